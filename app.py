@@ -5,13 +5,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from db_routing import RoutingSession, replica_binds
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 
 # create the app
@@ -21,10 +22,94 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///logistics.db")
+# pool sized for one serving worker; gunicorn.conf.py exports WORKER_DB_CONNECTIONS
+# for the chosen worker class (threads per gthread worker)
+worker_db_connections = int(os.environ.get("WORKER_DB_CONNECTIONS", 15))
+pool_size = int(os.environ.get("DB_POOL_SIZE", min(5, worker_db_connections)))
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update(
+        pool_size=pool_size,
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", max(0, worker_db_connections - pool_size))),
+        pool_timeout=int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    )
+# optional read replica for @replica_reads views (see db_routing.py), with its own pool
+replica_pool_size = int(os.environ.get("DB_REPLICA_POOL_SIZE", pool_size))
+app.config["SQLALCHEMY_BINDS"] = replica_binds(
+    os.environ.get("REPLICA_DATABASE_URL"),
+    pool_size=replica_pool_size,
+    max_overflow=int(os.environ.get("DB_REPLICA_MAX_OVERFLOW", max(0, worker_db_connections - replica_pool_size))),
+    pool_timeout=int(os.environ.get("DB_REPLICA_POOL_TIMEOUT", 10)),
+)
+app.config["REPLICA_STICKY_SECONDS"] = int(os.environ.get("REPLICA_STICKY_SECONDS", 10))  # primary reads after a client's own write
+
+# order listing pagination
+app.config["ORDERS_PAGE_SIZE"] = int(os.environ.get("ORDERS_PAGE_SIZE", 50))
+app.config["ORDERS_MAX_PAGE_SIZE"] = 200
+app.config["ORDERS_COUNT_CACHE_TTL"] = int(os.environ.get("ORDERS_COUNT_CACHE_TTL", 60))
+app.config["SEARCH_MAX_PAGES"] = 20  # ranked search results are paged by offset
+
+# tracking numbers are reserved from the database in blocks of this size per process
+app.config["TRACKING_SEQUENCE_BLOCK"] = 50
+
+# bulk import inserts valid rows in transactions of this size
+app.config["IMPORT_BATCH_SIZE"] = 500
+
+# notification outbox delivery (see notification_worker.py)
+app.config["OUTBOX_BATCH_SIZE"] = int(os.environ.get("OUTBOX_BATCH_SIZE", 50))
+app.config["OUTBOX_MAX_ATTEMPTS"] = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 8))
+app.config["OUTBOX_BACKOFF_BASE"] = 5  # seconds
+app.config["OUTBOX_BACKOFF_MAX"] = 3600
+app.config["OUTBOX_POLL_INTERVAL"] = 2
+
+# public tracking cache (see tracking_cache.py); REDIS_URL enables the shared tier
+app.config["REDIS_URL"] = os.environ.get("REDIS_URL")
+app.config["TRACKING_CACHE_TTL"] = int(os.environ.get("TRACKING_CACHE_TTL", 300))
+app.config["TRACKING_NEGATIVE_TTL"] = 30
+app.config["TRACKING_LOCAL_CACHE_SIZE"] = int(os.environ.get("TRACKING_LOCAL_CACHE_SIZE", 2048))
+app.config["TRACKING_LOCAL_CACHE_TTL"] = 10
+app.config["TRACKING_LONGPOLL_MAX"] = 25  # seconds a /api/track request may be held
+app.config["TRACKING_LONGPOLL_RECHECK"] = 2
+
+# driver dispatch board (see dispatch.py)
+app.config["DISPATCH_REFRESH_INTERVAL"] = 60  # seconds between full reloads of the in-memory view
+app.config["DISPATCH_MAX_BATCH"] = 100
+
+# Astana route planning (see geocoding.py and routing.py)
+app.config["GAZETTEER_PATH"] = os.environ.get("GAZETTEER_PATH", os.path.join(app.instance_path, "gazetteer.csv"))
+app.config["DEPOT_LAT"] = float(os.environ.get("DEPOT_LAT", 51.1282))
+app.config["DEPOT_LON"] = float(os.environ.get("DEPOT_LON", 71.4304))
+app.config["ROUTE_2OPT_MAX_PASSES"] = 50
+
+# server-sent order events for admin pages (see live_updates.py)
+app.config["LIVE_STREAM_MAX_DURATION"] = 300  # seconds before a stream ends and the browser reconnects
+app.config["LIVE_STREAM_HEARTBEAT"] = 15
+app.config["LIVE_STREAM_QUEUE_SIZE"] = 100
+# each open stream holds a gthread thread; beyond this many per worker, browsers are told to retry later
+app.config["LIVE_STREAM_MAX_CONNECTIONS"] = int(os.environ.get("LIVE_STREAM_MAX_CONNECTIONS", 4))
+app.config["LIVE_STREAM_BUSY_RETRY"] = 60  # seconds
+
+# request instrumentation and /metrics (see instrumentation.py)
+app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "0") == "1"  # off unless asked for
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")  # bearer token required by /metrics when set
+app.config["SLOW_REQUEST_MS"] = int(os.environ.get("SLOW_REQUEST_MS", 1000))
+app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+
+# time-in-status percentiles over this many days (see status_history.py)
+app.config["LEAD_TIME_WINDOW_DAYS"] = int(os.environ.get("LEAD_TIME_WINDOW_DAYS", 90))
+app.config["LEAD_TIME_REFRESH_INTERVAL"] = int(os.environ.get("LEAD_TIME_REFRESH_INTERVAL", 3600))  # recomputed by the notifications worker
+
+# template rendering (see templating.py)
+app.config["TEMPLATE_BYTECODE_CACHE_DIR"] = os.environ.get("TEMPLATE_BYTECODE_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache"))
+app.config["TEMPLATE_FRAGMENT_CACHE_SIZE"] = int(os.environ.get("TEMPLATE_FRAGMENT_CACHE_SIZE", 512))  # 0 disables {% cache %}
+app.config["TEMPLATE_STREAM_CHUNK"] = 16384  # characters per chunk of a streamed page
+
+# logged-in users are cached per process (see user_cache.py); changes reach other workers within the TTL
+app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", 30))
+app.config["USER_CACHE_SIZE"] = 1024
 
 # initialize extensions
 db.init_app(app)
@@ -32,10 +117,22 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Пожалуйста, войдите в систему для доступа к этой странице.'
 
+# per-view SQL query budgets, checked in debug and testing mode
+from query_budget import init_query_budget
+init_query_budget(app)
+from instrumentation import init_instrumentation
+init_instrumentation(app)
+from db_routing import init_db_routing
+init_db_routing(app, db)
+from templating import init_templating
+init_templating(app)
+from assets import init_assets
+init_assets(app)
+
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    from user_cache import load_user as load_cached_user
+    return load_cached_user(int(user_id))
 
 @app.context_processor
 def inject_csrf_token():
@@ -44,27 +141,36 @@ def inject_csrf_token():
     return dict(csrf_token=generate_csrf)
 
 with app.app_context():
-    # Import models to ensure tables are created
+    # Import models and bring the schema up to date
     import models
-    db.create_all()
-    
-    # Create default admin user if it doesn't exist
-    from models import User
-    from werkzeug.security import generate_password_hash
-    
-    admin = User.query.filter_by(username='admin').first()
-    if not admin:
-        admin_user = User(
-            username='admin',
-            email='admin@hrom-kz.com',
-            full_name='Системный администратор',
-            phone='+77771234567',
-            password_hash=generate_password_hash('admin123'),
-            role='logist'
-        )
-        db.session.add(admin_user)
-        db.session.commit()
-        print("Created default admin user: admin/admin123")
+    import migrations
+
+    # Web workers and the notifications worker start together; on SQLite
+    # only the lock keeps them from migrating or creating the admin twice
+    with migrations.startup_lock():
+        migrations.upgrade()
+
+        # Keep the analytics rollup in step with orders
+        import rollup
+        rollup.ensure_daily_rollup()
+
+        # Create default admin user if it doesn't exist
+        from models import User
+        from werkzeug.security import generate_password_hash
+
+        admin = User.query.filter_by(username='admin').first()
+        if not admin:
+            admin_user = User(
+                username='admin',
+                email='admin@hrom-kz.com',
+                full_name='Системный администратор',
+                phone='+77771234567',
+                password_hash=generate_password_hash('admin123'),
+                role='logist'
+            )
+            db.session.add(admin_user)
+            db.session.commit()
+            print("Created default admin user: admin/admin123")
 
 # Import routes after app initialization
 import routes
@@ -0,0 +1,328 @@
+"""Benchmark harness for the public and admin routes.
+
+Seeds a database with generated users, drivers and orders, then drives the
+app in-process through the Flask test client and reports per-scenario
+latency percentiles, SQL queries per request, and peak RSS and RSS growth
+while each scenario runs (on Linux the kernel's peak is reset between
+scenarios; elsewhere peak RSS is the process-wide maximum). Results can be
+stored as a baseline and later runs compared against it, so regressions
+show up before deploy:
+
+    python benchmark.py seed --database sqlite:///bench_100k.db --scale 100k
+    python benchmark.py run --database sqlite:///bench_100k.db --save-baseline
+    python benchmark.py run --database sqlite:///bench_100k.db      # exits 1 on regression
+
+The same works with a local PostgreSQL URL, e.g.
+postgresql://localhost/logistics_bench. The database must be empty before
+seeding. Generated data is deterministic for a given scale.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+BATCH_SIZE = 5000
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+
+FIRST_NAMES = ['Айдар', 'Алия', 'Ерлан', 'Дана', 'Нурлан', 'Асель', 'Марат', 'Жанна', 'Сергей', 'Ольга']
+LAST_NAMES = ['Ахметов', 'Сейткали', 'Иванов', 'Касымова', 'Жумабаев', 'Петрова', 'Нурланов', 'Ким']
+STREETS = ['Кенесары', 'Абая', 'Республики', 'Сарыарка', 'Туран', 'Кабанбай батыра', 'Мангилик Ел', 'Сыганак']
+CITIES = ['Астана', 'Алматы', 'Караганда', 'Шымкент', 'Актобе', 'Павлодар']
+CARGO = ['хромовая руда', 'оборудование', 'запчасти', 'документы', 'стройматериалы', 'паллеты с упаковкой']
+STATUS_WEIGHTS = (('new', 10), ('confirmed', 10), ('in_progress', 10), ('delivered', 60), ('cancelled', 10))
+
+
+def phone(rng):
+    return f"+7 70{rng.randint(0, 9)} {rng.randint(100, 999)} {rng.randint(10, 99)} {rng.randint(10, 99)}"
+
+
+def seed(scale, orders_count):
+    from sqlalchemy import insert, update
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from models import User, Driver, Order, TrackingSequence
+    from utils import normalize_phone
+    from tracking_numbers import check_character, encode_sequence
+    import rollup
+
+    if db.session.query(Order.id).limit(1).first() is not None:
+        raise SystemExit("The database already has orders; seed an empty database")
+
+    rng = random.Random(scale)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash('bench123')
+
+    user_count = max(10, orders_count // 100)
+    users = []
+    for index in range(user_count):
+        number = phone(rng)
+        users.append({
+            'username': f'bench{index}', 'email': f'bench{index}@example.kz',
+            'full_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'phone': number, 'phone_e164': normalize_phone(number),
+            'password_hash': password_hash, 'role': 'employee', 'created_at': now - timedelta(days=400),
+        })
+    db.session.execute(insert(User), users)
+
+    drivers = []
+    for index in range(50):
+        number = phone(rng)
+        drivers.append({
+            'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", 'phone': number,
+            'phone_e164': normalize_phone(number), 'vehicle_info': f'Газель {index:03}',
+            'is_active': index < 40, 'created_at': now - timedelta(days=400),
+        })
+    db.session.execute(insert(Driver), drivers)
+    db.session.commit()
+
+    user_ids = [row[0] for row in db.session.query(User.id).filter(User.role == 'employee')]
+    driver_ids = [row[0] for row in db.session.query(Driver.id)]
+    statuses = [status for status, weight in STATUS_WEIGHTS for _ in range(weight)]
+
+    started = time.monotonic()
+    for batch_start in range(0, orders_count, BATCH_SIZE):
+        batch = []
+        for sequence in range(batch_start + 1, min(batch_start + BATCH_SIZE, orders_count) + 1):
+            created_at = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            status = rng.choice(statuses)
+            body = created_at.strftime('%y%m%d') + encode_sequence(sequence)
+            shipping_type = rng.choice(('astana', 'kazakhstan'))
+            city = 'Астана' if shipping_type == 'astana' else rng.choice(CITIES)
+            number = phone(rng)
+            batch.append({
+                'tracking_number': f'HK{body}{check_character(body)}',
+                'customer_id': rng.choice(user_ids) if rng.random() < 0.7 else None,
+                'customer_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                'customer_phone': number, 'customer_phone_e164': normalize_phone(number),
+                'customer_email': None, 'shipping_type': shipping_type,
+                'pickup_address': f"г. Астана, ул. {rng.choice(STREETS)}, {rng.randint(1, 120)}",
+                'pickup_contact': None,
+                'delivery_address': f"г. {city}, ул. {rng.choice(STREETS)}, {rng.randint(1, 120)}",
+                'delivery_contact': None,
+                'cargo_description': rng.choice(CARGO), 'cargo_weight': round(rng.uniform(1, 5000), 1),
+                'cargo_dimensions': None, 'customer_notes': None,
+                'status': status,
+                'price': round(rng.uniform(5000, 500000), -2) if status != 'new' else None,
+                'driver_id': rng.choice(driver_ids) if status in ('confirmed', 'in_progress', 'delivered') else None,
+                'internal_comments': None,
+                'created_at': created_at, 'updated_at': created_at,
+            })
+        db.session.execute(insert(Order), batch)
+        db.session.commit()
+        print(f"  {min(batch_start + BATCH_SIZE, orders_count):>9} orders ({time.monotonic() - started:.0f}s)")
+
+    # Numbers issued by the app from now on must not collide with the seeded ones
+    db.session.execute(update(TrackingSequence).where(TrackingSequence.name == 'order')
+                       .values(next_value=orders_count + 1))
+    db.session.commit()
+    rollup.rebuild_daily_rollup()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _proc_status_mb(field):
+    """VmRSS or VmHWM from /proc/self/status in MB, None where /proc is unavailable"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Start a new peak RSS measurement; True when the kernel supports it (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def rss_mb():
+    current = _proc_status_mb('VmRSS')
+    return current if current is not None else peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss(), or of the whole process where it can't be reset"""
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def build_scenarios(rng, tracking_numbers):
+    order_form = {
+        'customer_name': 'Бенчмарк Клиент', 'customer_phone': '+7 701 555 00 00',
+        'pickup_address': 'г. Астана, ул. Кенесары, 40', 'delivery_address': 'г. Астана, пр. Республики, 15',
+        'cargo_description': 'Тестовый груз для бенчмарка', 'cargo_weight': '120',
+    }
+    return [
+        # (name, log in as logist, request function)
+        ('create_order', False, lambda client: client.post('/order/astana', data=order_form)),
+        ('track_order', False, lambda client: client.get(f'/track/{rng.choice(tracking_numbers)}')),
+        ('admin_orders', True, lambda client: client.get('/admin/orders')),
+        ('admin_orders_filtered', True, lambda client: client.get('/admin/orders?status=delivered&shipping_type=astana')),
+        ('admin_dashboard', True, lambda client: client.get('/admin')),
+        ('analytics', True, lambda client: client.get('/admin/analytics')),
+        ('analytics_data', True, lambda client: client.get('/admin/analytics/data')),
+    ]
+
+
+def run(iterations, warmup):
+    from app import app, db
+    from models import Order
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    rng = random.Random(1)
+    with app.app_context():
+        order_count = db.session.query(Order.id).count()
+        tracking_numbers = [row[0] for row in db.session.query(Order.tracking_number)
+                            .order_by(Order.id).limit(20000)]
+        dialect = db.engine.dialect.name
+        counter = QueryCounter(db.engine)
+    if not tracking_numbers:
+        raise SystemExit("The database has no orders; run 'seed' first")
+
+    results = {}
+    for name, as_logist, request in build_scenarios(rng, tracking_numbers):
+        client = app.test_client()
+        if as_logist:
+            client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+        rss_before = rss_mb()
+        per_scenario_peak = reset_peak_rss()
+        for _ in range(warmup):
+            request(client).close()
+
+        latencies, queries, errors = [], [], 0
+        for _ in range(iterations):
+            before = counter.count
+            started = time.perf_counter()
+            response = request(client)
+            # Streamed pages render while the body is read
+            response.get_data()
+            response.close()
+            latencies.append(time.perf_counter() - started)
+            queries.append(counter.count - before)
+            if response.status_code >= 400:
+                errors += 1
+        results[name] = {
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'queries': max(queries),
+            'errors': errors,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'rss_growth_mb': round(rss_mb() - rss_before, 1),
+        }
+        if not per_scenario_peak:
+            # Without a resettable peak it is the process-wide maximum so far
+            results[name]['peak_rss_scope'] = 'process'
+
+    return f"{dialect}-{scale_label(order_count)}", results
+
+
+def scale_label(order_count):
+    return min(SCALES, key=lambda label: abs(SCALES[label] - order_count))
+
+
+def compare(baseline, results, tolerance):
+    """Regressions against the baseline: slower p95 beyond tolerance, or more queries"""
+    problems = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {result['p95_ms']}ms vs baseline {reference['p95_ms']}ms")
+        if result['queries'] > reference['queries']:
+            problems.append(f"{name}: {result['queries']} queries vs baseline {reference['queries']}")
+        if result['errors']:
+            problems.append(f"{name}: {result['errors']} failed requests")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    seed_parser = commands.add_parser('seed', help='fill an empty database with generated data')
+    seed_parser.add_argument('--database', required=True, help='SQLAlchemy URL')
+    seed_parser.add_argument('--scale', choices=SCALES, default='10k')
+    run_parser = commands.add_parser('run', help='run the scenarios and compare with the baseline')
+    run_parser.add_argument('--database', required=True, help='SQLAlchemy URL')
+    run_parser.add_argument('--iterations', type=int, default=200)
+    run_parser.add_argument('--warmup', type=int, default=10)
+    run_parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    run_parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    run_parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    # app.py reads these at import time
+    os.environ['DATABASE_URL'] = args.database
+    import logging
+    logging.disable(logging.INFO)
+
+    if args.command == 'seed':
+        from app import app
+        with app.app_context():
+            print(f"Seeding {args.scale} orders into {args.database}")
+            seed(SCALES[args.scale], SCALES[args.scale])
+        return
+
+    key, results = run(args.iterations, args.warmup)
+    print(f"{key}, {args.iterations} requests per scenario")
+    print(f"{'scenario':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'RSS MB':>8} {'+RSS MB':>8}")
+    for name, result in results.items():
+        print(f"{name:<24} {result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} "
+              f"{result['queries']:>8} {result['peak_rss_mb']:>8} {result['rss_growth_mb']:>8}")
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as stream:
+            stored = json.load(stream)
+
+    if args.save_baseline:
+        stored[key] = results
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as stream:
+            json.dump(stored, stream, indent=2, sort_keys=True)
+        print(f"Saved baseline {key} to {args.baseline}")
+        return
+
+    if key not in stored:
+        print(f"No baseline for {key}; run with --save-baseline to create one")
+        return
+    problems = compare(stored[key], results, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Bulk order import (CSV/XLSX) and streaming CSV export.
+
+Imports validate every row with forms.OrderForm, insert valid rows in batched
+transactions with one multi-row INSERT per batch, and report errors per row.
+Each batch triggers the same follow-ups as orders created from the site, with
+one Telegram summary per batch instead of a message per order.
+Exports read through a server-side cursor and are written out in chunks, so
+memory use stays flat however many orders are moved.
+"""
+import codecs
+import csv
+import io
+import click
+from datetime import datetime
+from sqlalchemy import insert
+from werkzeug.datastructures import MultiDict
+
+from app import app, db
+from models import Order, Driver
+from forms import OrderForm
+from rollup import record_bulk_insert
+from order_events import record_created
+from tracking_numbers import generate_tracking_number
+from utils import normalize_phone
+
+try:
+    import openpyxl
+except ImportError:  # XLSX import is optional
+    openpyxl = None
+
+IMPORT_FIELDS = (
+    'customer_name', 'customer_phone', 'customer_email', 'shipping_type',
+    'pickup_address', 'pickup_contact', 'delivery_address', 'delivery_contact',
+    'cargo_description', 'cargo_weight', 'cargo_dimensions', 'customer_notes',
+)
+
+EXPORT_COLUMNS = (
+    ('Номер', Order.tracking_number),
+    ('Статус', Order.status),
+    ('Тип доставки', Order.shipping_type),
+    ('Клиент', Order.customer_name),
+    ('Телефон', Order.customer_phone),
+    ('Email', Order.customer_email),
+    ('Адрес погрузки', Order.pickup_address),
+    ('Адрес выгрузки', Order.delivery_address),
+    ('Описание груза', Order.cargo_description),
+    ('Вес, кг', Order.cargo_weight),
+    ('Цена', Order.price),
+    ('Водитель', Driver.name),
+    ('Создан', Order.created_at),
+)
+
+# Leading characters that make Excel or LibreOffice treat a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+MAX_REPORTED_ERRORS = 500
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []  # (row number, {field: [messages]}), capped at MAX_REPORTED_ERRORS
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, errors))
+
+
+def iter_csv_rows(stream):
+    """Yield dict rows from a binary CSV stream without reading it all into memory"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.DictReader(text, dialect=dialect)
+
+
+def iter_xlsx_rows(stream):
+    """Yield dict rows from the first sheet of an XLSX workbook (needs openpyxl)"""
+    if openpyxl is None:
+        raise ValueError('Импорт XLSX недоступен: не установлен пакет openpyxl')
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, [])]
+        for values in rows:
+            yield {key: '' if value is None else str(value) for key, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+def validate_row(row):
+    """Validate one import row with the same rules as the order form.
+
+    Returns (values, errors); values is None when the row is invalid.
+    """
+    data = MultiDict({field: (row.get(field) or '').strip() for field in IMPORT_FIELDS})
+    form = OrderForm(formdata=data, meta={'csrf': False})
+    errors = {} if form.validate() else dict(form.errors)
+
+    shipping_type = data.get('shipping_type')
+    if shipping_type not in ('astana', 'kazakhstan'):
+        errors['shipping_type'] = ['Допустимые значения: astana, kazakhstan']
+    if errors:
+        return None, errors
+
+    values = {field: form[field].data for field in IMPORT_FIELDS if field != 'shipping_type'}
+    values['shipping_type'] = shipping_type
+    return values, None
+
+
+def _insert_batch(batch):
+    """Insert one batch in its own transaction, keeping the analytics rollup in step.
+
+    The bulk INSERT skips flush events, so the inserted orders are announced
+    to order_events: the commit then queues notifications and status history
+    and updates caches and live pages as for orders created one by one.
+    """
+    orders = db.session.scalars(insert(Order).returning(Order), batch).all()
+    record_bulk_insert(db.session.connection(), batch)
+    record_created(db.session, orders)
+    db.session.commit()
+
+
+def import_orders(rows, customer_id=None, batch_size=None):
+    """Validate and insert orders from an iterable of dict rows"""
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    result = ImportResult()
+    batch = []
+
+    # Row 1 is the header line
+    for row_number, row in enumerate(rows, start=2):
+        values, errors = validate_row(row)
+        if errors:
+            result.add_error(row_number, errors)
+            continue
+
+        now = datetime.utcnow()
+        values.update(
+            tracking_number=generate_tracking_number(),
+            # Bulk INSERT skips the model's @validates hooks
+            customer_phone_e164=normalize_phone(values['customer_phone']),
+            customer_id=customer_id,
+            status='new',
+            driver_id=None,
+            price=None,
+            created_at=now,
+            updated_at=now
+        )
+        batch.append(values)
+        if len(batch) >= batch_size:
+            _insert_batch(batch)
+            result.imported += len(batch)
+            batch = []
+
+    if batch:
+        _insert_batch(batch)
+        result.imported += len(batch)
+
+    return result
+
+
+def csv_safe(value):
+    """Keep spreadsheet apps from running a text cell as a formula"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_orders_csv(query, chunk_rows=1000):
+    """Yield CSV text chunks for the orders matched by an Order query.
+
+    Only the exported columns are selected, and rows are fetched with
+    yield_per so the driver streams them from a server-side cursor. Text
+    comes from the public order form, so cells are passed through csv_safe().
+    """
+    stmt = query.with_entities(*(column for _, column in EXPORT_COLUMNS)).outerjoin(
+        Driver, Order.driver_id == Driver.id
+    ).order_by(None).order_by(Order.created_at.desc(), Order.id.desc()).statement
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the Cyrillic text as UTF-8
+    buffer.write(codecs.BOM_UTF8.decode('utf-8'))
+    writer.writerow([title for title, _ in EXPORT_COLUMNS])
+
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_rows))
+    for partition in result.partitions():
+        for row in partition:
+            writer.writerow([csv_safe(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@app.cli.command('import-orders')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_orders_command(path):
+    """Import orders from a CSV or XLSX file.
+
+    Imported orders get status history, live updates and one Telegram
+    summary per batch, like orders created on the site.
+    """
+    with open(path, 'rb') as stream:
+        rows = iter_xlsx_rows(stream) if path.lower().endswith('.xlsx') else iter_csv_rows(stream)
+        result = import_orders(rows)
+
+    print(f"Imported {result.imported} orders, {result.failed} rows rejected")
+    for row_number, errors in result.errors:
+        print(f"  row {row_number}: " + '; '.join(f"{field}: {', '.join(messages)}" for field, messages in errors.items()))
@@ -0,0 +1,105 @@
+"""Read-replica routing for db.session.
+
+With REPLICA_DATABASE_URL set, views marked with @replica_reads run their
+queries against the replica bind, so heavy aggregations on the analytics
+and dashboard pages don't compete with order writes on the primary.
+Everything else, and any statement that writes or locks, stays on the
+primary.
+
+A client that commits a write is pinned to the primary for
+REPLICA_STICKY_SECONDS (kept in its Flask session cookie), so a logist who
+edits an order and opens the dashboard sees their own change even while the
+replica lags behind. Once the session has flushed in a request, the rest of
+that request reads from the primary as well.
+"""
+import time
+from flask import g, request, session as flask_session, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+REPLICA_BIND = 'replica'
+STICKY_KEY = '_db_primary_until'
+
+
+def replica_reads(view):
+    """Mark a read-only view whose queries may be served by the replica"""
+    view.replica_reads = True
+    return view
+
+
+def reads_from_replica():
+    """Whether queries in the current request go to the replica"""
+    return has_request_context() and bool(g.get('read_replica')) and not g.get('db_wrote')
+
+
+class RoutingSession(Session):
+    """Session that sends reads of replica-marked views to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if not reads_from_replica() or self._flushing:
+            return False
+        if clause is not None and (getattr(clause, 'is_dml', False)
+                                   or getattr(clause, '_for_update_arg', None) is not None):
+            return False
+        return True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_to_primary(session):
+    # db_wrote stays set: the rest of this request must keep reading its own write from the primary
+    if has_request_context() and g.get('db_wrote') and g.get('replica_sticky_seconds'):
+        flask_session[STICKY_KEY] = time.time() + g.replica_sticky_seconds
+
+
+def replica_binds(replica_url, pool_size, max_overflow, pool_timeout):
+    """SQLALCHEMY_BINDS entry for the replica, with its own pool settings"""
+    if not replica_url:
+        return {}
+    return {REPLICA_BIND: {
+        'url': replica_url,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    }}
+
+
+def init_db_routing(app, db):
+    """Route replica-marked views to the replica bind when one is configured"""
+
+    @app.cli.command('replica-status')
+    def replica_status_command():
+        """Show whether the replica is configured, in recovery, and how far it lags."""
+        if REPLICA_BIND not in db.engines:
+            print("No replica configured; all queries use the primary")
+            return
+        with db.engines[REPLICA_BIND].connect() as connection:
+            in_recovery, lag = connection.execute(text(
+                "SELECT pg_is_in_recovery(), "
+                "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+            )).one()
+        print(f"Replica in recovery: {in_recovery}")
+        print(f"Replay lag: {lag:.1f}s" if lag is not None else "Replay lag: unknown (nothing replayed yet)")
+
+    if REPLICA_BIND not in app.config['SQLALCHEMY_BINDS']:
+        return
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    @app.before_request
+    def choose_read_bind():
+        g.replica_sticky_seconds = sticky_seconds
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, 'replica_reads', False):
+            g.read_replica = time.time() >= flask_session.get(STICKY_KEY, 0)
@@ -0,0 +1,153 @@
+"""Driver dispatch board.
+
+Each process keeps an in-memory view of the active drivers and their open
+orders (confirmed or in progress). It is loaded with two queries and then
+kept up to date from committed order changes (see order_events.py), so the
+board and the driver picker on the order form don't query the database per
+page. Changes committed by other processes are picked up when the view is
+reloaded, every DISPATCH_REFRESH_INTERVAL seconds.
+"""
+import copy
+import heapq
+import threading
+import time
+from sqlalchemy.orm import load_only
+
+from app import app, db
+from models import Driver, Order
+from order_events import on_order_change
+
+OPEN_STATUSES = ('confirmed', 'in_progress')
+
+
+class DriverLoad:
+    """An active driver with the open orders assigned to them"""
+
+    def __init__(self, driver):
+        self.id = driver.id
+        self.name = driver.name
+        self.phone = driver.phone
+        self.vehicle_info = driver.vehicle_info
+        self.open_orders = {}  # order id -> tracking number
+
+    @property
+    def load(self):
+        return len(self.open_orders)
+
+    def snapshot(self):
+        """A copy that stays as it is while the board keeps changing"""
+        driver = copy.copy(self)
+        driver.open_orders = dict(self.open_orders)
+        return driver
+
+
+class DispatchBoard:
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._drivers = {}
+        self._assignments = {}  # open order id -> driver id
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        drivers = Driver.query.options(
+            load_only(Driver.id, Driver.name, Driver.phone, Driver.vehicle_info)
+        ).filter_by(is_active=True).all()
+        open_orders = db.session.query(Order.id, Order.tracking_number, Order.driver_id).filter(
+            Order.status.in_(OPEN_STATUSES), Order.driver_id.isnot(None)
+        ).all()
+
+        self._drivers = {driver.id: DriverLoad(driver) for driver in drivers}
+        self._assignments = {}
+        for order_id, tracking_number, driver_id in open_orders:
+            self._assignments[order_id] = driver_id
+            if driver_id in self._drivers:
+                self._drivers[driver_id].open_orders[order_id] = tracking_number
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            self._load()
+
+    def drivers(self):
+        """Snapshots of the active drivers, least loaded first"""
+        with self._lock:
+            self._ensure_loaded()
+            return sorted((driver.snapshot() for driver in self._drivers.values()),
+                          key=lambda d: (d.load, d.name))
+
+    def driver(self, driver_id):
+        """Snapshot of one active driver, or None if unknown or the board isn't loaded"""
+        with self._lock:
+            driver = self._drivers.get(driver_id) if self._loaded_at is not None else None
+            return driver.snapshot() if driver else None
+
+    def apply_change(self, order_id, tracking_number, status, driver_id):
+        """Update the view for one committed order change"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            previous = self._assignments.pop(order_id, None)
+            if previous in self._drivers:
+                self._drivers[previous].open_orders.pop(order_id, None)
+            if status in OPEN_STATUSES and driver_id is not None:
+                self._assignments[order_id] = driver_id
+                if driver_id in self._drivers:
+                    self._drivers[driver_id].open_orders[order_id] = tracking_number
+
+    def invalidate(self):
+        """Reload on next use, e.g. after drivers were added or deactivated"""
+        with self._lock:
+            self._loaded_at = None
+
+
+board = DispatchBoard(app.config['DISPATCH_REFRESH_INTERVAL'])
+
+
+def driver_choices():
+    """Choices for OrderEditForm.driver_id, least loaded drivers first"""
+    return [(0, 'Не назначен')] + [
+        (driver.id, f'{driver.name} ({driver.phone}) — в работе: {driver.load}')
+        for driver in board.drivers()
+    ]
+
+
+def assign_new_orders(count):
+    """Assign up to ``count`` of the oldest unassigned new orders, balancing driver load.
+
+    Each order goes to the driver with the fewest open orders at that moment
+    and is confirmed. Returns a list of (order, DriverLoad) pairs.
+    """
+    drivers = board.drivers()
+    if not drivers or count <= 0:
+        return []
+
+    # SKIP LOCKED keeps two dispatchers from picking the same orders
+    orders = Order.query.filter(
+        Order.status == 'new', Order.driver_id.is_(None)
+    ).order_by(Order.created_at, Order.id).limit(count).with_for_update(skip_locked=True).all()
+
+    heap = [(driver.load, driver.id, driver) for driver in drivers]
+    heapq.heapify(heap)
+    assignments = []
+    for order in orders:
+        load, _, driver = heapq.heappop(heap)
+        order.driver_id = driver.id
+        order.status = 'confirmed'
+        assignments.append((order, driver))
+        heapq.heappush(heap, (load + 1, driver.id, driver))
+
+    # The board itself is updated by update_dispatch_board once this commits
+    db.session.commit()
+    return assignments
+
+
+def unassigned_count():
+    return Order.query.filter(Order.status == 'new', Order.driver_id.is_(None)).count()
+
+
+@on_order_change(after_commit=True)
+def update_dispatch_board(changes):
+    for change in changes:
+        if change.created or 'status' in change.changes or 'driver_id' in change.changes:
+            board.apply_change(change.order_id, change.tracking_number, change.status, change.driver_id)
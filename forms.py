@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SelectField, FloatField, PasswordField, EmailField, TelField
+from wtforms import StringField, TextAreaField, SelectField, FloatField, IntegerField, PasswordField, EmailField, TelField
 from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange
 
 class OrderForm(FlaskForm):
@@ -58,3 +58,6 @@ class DriverForm(FlaskForm):
     name = StringField('Имя водителя', validators=[DataRequired(), Length(min=2, max=100)])
     phone = TelField('Номер телефона', validators=[DataRequired(), Length(min=10, max=20)])
     vehicle_info = StringField('Информация о транспорте', validators=[Optional(), Length(max=200)])
+
+class DispatchForm(FlaskForm):
+    count = IntegerField('Количество заказов', default=10, validators=[DataRequired(), NumberRange(min=1, max=100)])
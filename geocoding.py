@@ -0,0 +1,110 @@
+"""Offline geocoding of Astana addresses from a local gazetteer.
+
+The gazetteer is a CSV file (GAZETTEER_PATH) with an ``address,lat,lon``
+header. Rows may be full addresses ("ул. Кенесары 40") or just streets
+("проспект Республики"), which then serve as a fallback for any house on
+that street. Addresses are compared in a normalized form, so "г. Астана,
+ул. Кенесары, д. 40, кв. 5" and "Кенесары 40" resolve to the same entry.
+
+The file is read once per process and again only when it changes on disk;
+lookups are cached per normalized address.
+"""
+import csv
+import logging
+import os
+import re
+import threading
+
+from app import app
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'[\w-]+', re.UNICODE)
+
+# City names and street-type words that don't help tell addresses apart
+NOISE_WORDS = {
+    'г', 'город', 'астана', 'нур-султан', 'казахстан', 'рк',
+    'ул', 'улица', 'пр', 'пр-т', 'просп', 'проспект', 'пер', 'переулок',
+    'бул', 'бульвар', 'ш', 'шоссе', 'мкр', 'микрорайон', 'ж', 'жк', 'д', 'дом',
+}
+# Words followed by a number that only matters inside the building
+UNIT_WORDS = {'кв', 'квартира', 'оф', 'офис', 'под', 'подъезд', 'эт', 'этаж'}
+
+
+def normalize_address(address):
+    """Lower-case words of an address without city, street types and flat numbers"""
+    words = WORD_RE.findall((address or '').lower().replace('ё', 'е'))
+    result = []
+    skip_next = False
+    for word in words:
+        if skip_next:
+            skip_next = False
+            continue
+        if word in UNIT_WORDS:
+            skip_next = True
+            continue
+        if word in NOISE_WORDS:
+            continue
+        result.append(word)
+    return ' '.join(result)
+
+
+class Gazetteer:
+    """Normalized address -> (lat, lon), reloaded when the file changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._cache = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self._mtime is not None:
+                logger.warning("Gazetteer %s is no longer available", self.path)
+            self._entries, self._cache, self._mtime = {}, {}, None
+            return
+        if mtime == self._mtime:
+            return
+
+        entries = {}
+        with open(self.path, encoding='utf-8-sig', newline='') as stream:
+            for row in csv.DictReader(stream):
+                try:
+                    point = (float(row['lat']), float(row['lon']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                key = normalize_address(row.get('address'))
+                if key:
+                    entries[key] = point
+        self._entries, self._cache, self._mtime = entries, {}, mtime
+        logger.info("Loaded %d gazetteer entries from %s", len(entries), self.path)
+
+    def lookup(self, address):
+        """Coordinates for an address, or None if neither it nor its street is known"""
+        key = normalize_address(address)
+        with self._lock:
+            self._reload_if_changed()
+            if key in self._cache:
+                return self._cache[key]
+
+            point = None
+            words = key.split()
+            # Most specific first: drop trailing words (house, building) until something matches
+            while words and point is None:
+                point = self._entries.get(' '.join(words))
+                words.pop()
+            if len(self._cache) > 10000:
+                self._cache.clear()
+            self._cache[key] = point
+            return point
+
+
+gazetteer = Gazetteer(app.config['GAZETTEER_PATH'])
+
+
+def geocode(address):
+    return gazetteer.lookup(address)
@@ -0,0 +1,101 @@
+"""Gunicorn settings, picked up automatically by ``gunicorn main:app``.
+
+Workers are threaded (gthread) by default, so a slow query, a long-poll on
+/api/track or a held /admin/events stream occupies one thread instead of a
+whole worker process. GUNICORN_WORKER_CLASS=gevent switches to greenlets for
+much higher connection counts (needs the gevent package; psycogreen is used
+when installed so psycopg2 waits cooperatively).
+
+The number of database connections one worker may need is exported to the
+app as WORKER_DB_CONNECTIONS, and app.py sizes its SQLAlchemy pool from it.
+on_starting checks the total against what the database allows.
+
+Unless NOTIFICATIONS_WORKER=0, the master also starts one
+``flask notifications-worker`` process next to the web workers, so queued
+notifications are delivered and lead-time statistics refreshed with nothing
+else to run. Set it to 0 when the worker is deployed separately.
+"""
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+
+logger = logging.getLogger('gunicorn.error')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Gunicorn turns sync workers into gthread ones when threads > 1
+threads = int(os.environ.get('GUNICORN_THREADS', 16)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Long-polls wait up to TRACKING_LONGPOLL_MAX (25s) and event streams send a
+# heartbeat every 15s, so the timeout must stay above both
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+if worker_class == 'gevent':
+    # Greenlets beyond this wait for a pooled connection instead of opening more
+    db_connections = int(os.environ.get('DB_CONNECTIONS_PER_WORKER', 20))
+elif worker_class == 'gthread':
+    # Every request thread can hold a connection without waiting on the pool
+    db_connections = threads
+else:
+    db_connections = 1
+os.environ.setdefault('WORKER_DB_CONNECTIONS', str(db_connections))
+
+run_notifications_worker = os.environ.get('NOTIFICATIONS_WORKER', '1') != '0'
+notifications_worker = None
+
+
+def on_starting(server):
+    per_worker = int(os.environ['WORKER_DB_CONNECTIONS'])
+    explicit_pool = os.environ.get('DB_POOL_SIZE'), os.environ.get('DB_MAX_OVERFLOW')
+    if all(explicit_pool):
+        per_worker = sum(int(value) for value in explicit_pool)
+        if worker_class == 'gthread' and per_worker < threads:
+            logger.warning("DB_POOL_SIZE + DB_MAX_OVERFLOW (%d) is below GUNICORN_THREADS (%d); "
+                           "busy threads will wait up to DB_POOL_TIMEOUT for a connection", per_worker, threads)
+
+    # One extra connection per worker for the order events LISTEN thread
+    total = workers * (per_worker + 1)
+    limit = int(os.environ.get('DB_MAX_CONNECTIONS', 100))
+    if total > limit:
+        logger.warning("%d workers may open %d database connections, above DB_MAX_CONNECTIONS=%d; "
+                       "lower WEB_CONCURRENCY, GUNICORN_THREADS or DB_CONNECTIONS_PER_WORKER",
+                       workers, total, limit)
+    logger.info("Serving with %d %s workers (%s per worker), up to %d database connections",
+                workers, worker_class,
+                f"{threads} threads" if worker_class == 'gthread' else
+                f"{worker_connections} connections" if worker_class == 'gevent' else "1 request",
+                total)
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            logger.warning("psycogreen is not installed; database calls will block the gevent worker")
+        else:
+            patch_psycopg()
+
+
+def when_ready(server):
+    global notifications_worker
+    if run_notifications_worker:
+        notifications_worker = subprocess.Popen(
+            [sys.executable, '-m', 'flask', '--app', 'main', 'notifications-worker'],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        logger.info("Started the notifications worker (pid %d)", notifications_worker.pid)
+
+
+def on_exit(server):
+    if notifications_worker is not None and notifications_worker.poll() is None:
+        notifications_worker.terminate()
+        try:
+            notifications_worker.wait(graceful_timeout)
+        except subprocess.TimeoutExpired:
+            notifications_worker.kill()
@@ -0,0 +1,218 @@
+"""Request, SQL, template and outbound HTTP instrumentation.
+
+Per-request timings are kept in process-local counters and histograms and
+served in the Prometheus text format from /metrics. Each gunicorn worker
+keeps its own numbers, labelled with its pid so they can be summed.
+Requests slower than SLOW_REQUEST_MS are logged with their SQL and template
+time, and a PROFILE_SAMPLE_RATE fraction of requests runs under cProfile,
+whose top functions are added to the slow-request log entry.
+
+Streamed pages such as the order listing are recorded when the server closes
+them, so their duration, queries and template time cover the whole body and
+not just the part before the first chunk. Event streams stay open for
+minutes and are recorded when they start.
+
+METRICS_ENABLED is off by default; with it off no hooks are installed at all.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from senders import http_session
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self, format_labels):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self, format_labels):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    labels = format_labels(self.labels + ('le',), label_values + (f"{bound:g}",))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(self.labels + ('le',), label_values + ('+Inf',))
+                lines.append(f"{self.name}_bucket{labels} {entry[-1]}")
+                plain = format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{plain} {entry[-2]:g}")
+                lines.append(f"{self.name}_count{plain} {entry[-1]}")
+        return lines
+
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests served', ('endpoint', 'method', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Request handling time', ('endpoint',))
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed', ('endpoint',))
+DB_TIME = Counter('db_query_seconds_total', 'Time spent in SQL statements', ('endpoint',))
+TEMPLATE_DURATION = Histogram('template_render_seconds', 'Template render time', ('template',))
+OUTBOUND_REQUESTS = Counter('outbound_http_requests_total', 'Outbound HTTP calls', ('host', 'status'))
+OUTBOUND_DURATION = Histogram('outbound_http_duration_seconds', 'Outbound HTTP call time', ('host',))
+METRICS = (REQUESTS, REQUEST_DURATION, DB_QUERIES, DB_TIME, TEMPLATE_DURATION, OUTBOUND_REQUESTS, OUTBOUND_DURATION)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    pairs = [f'pid="{os.getpid()}"'] + [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}'
+
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(_format_labels))
+    return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if started and has_request_context():
+        g.sql_time = g.get('sql_time', 0.0) + time.perf_counter() - started.pop()
+
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('template_started', []).append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    started = g.get('template_started')
+    if started:
+        elapsed = time.perf_counter() - started.pop()
+        g.template_time = g.get('template_time', 0.0) + elapsed
+        TEMPLATE_DURATION.observe((template.name or 'string',), elapsed)
+
+
+def _record_outbound(response, *args, **kwargs):
+    host = urlsplit(response.url).hostname or 'unknown'
+    elapsed = response.elapsed.total_seconds()
+    OUTBOUND_REQUESTS.inc((host, response.status_code))
+    OUTBOUND_DURATION.observe((host,), elapsed)
+    if has_request_context():
+        g.outbound_time = g.get('outbound_time', 0.0) + elapsed
+
+
+def init_instrumentation(app):
+    """Install the hooks when METRICS_ENABLED is set"""
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    http_session.hooks['response'].append(_record_outbound)
+
+    slow_threshold = app.config['SLOW_REQUEST_MS'] / 1000
+    sample_rate = app.config['PROFILE_SAMPLE_RATE']
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        if sample_rate and random.random() < sample_rate:
+            g.profiler = cProfile.Profile()
+            try:
+                g.profiler.enable()
+            except ValueError:
+                # Another profiler is already active in this thread
+                g.profiler = None
+
+    def finish_request(state, method, path, endpoint, status, started):
+        elapsed = time.perf_counter() - started
+        queries = state.get('query_count', 0)
+
+        REQUESTS.inc((endpoint, method, status))
+        REQUEST_DURATION.observe((endpoint,), elapsed)
+        DB_QUERIES.inc((endpoint,), queries)
+        DB_TIME.inc((endpoint,), state.get('sql_time', 0.0))
+
+        profiler = state.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        if elapsed >= slow_threshold:
+            message = (f"Slow request {method} {path} ({endpoint}): {elapsed * 1000:.0f}ms, "
+                       f"{queries} queries in {state.get('sql_time', 0.0) * 1000:.0f}ms, "
+                       f"templates {state.get('template_time', 0.0) * 1000:.0f}ms, "
+                       f"outbound HTTP {state.get('outbound_time', 0.0) * 1000:.0f}ms")
+            if profiler is not None:
+                output = io.StringIO()
+                pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(25)
+                message += '\n' + output.getvalue()
+            logger.warning(message)
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        details = (g._get_current_object(), request.method, request.path,
+                   request.endpoint or 'unmatched', response.status_code, started)
+        if response.is_streamed and response.mimetype != 'text/event-stream':
+            # The body is generated after this hook; g keeps collecting until the server closes it
+            response.call_on_close(lambda: finish_request(*details))
+        else:
+            finish_request(*details)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request doesn't run when the view raised
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
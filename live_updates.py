@@ -0,0 +1,219 @@
+"""Server-sent events with committed order changes.
+
+Admin pages subscribe to ``/admin/events`` and patch themselves in place
+(see initializeLiveUpdates in static/js/main.js), so idle viewers cost a
+held connection instead of periodic full page reloads.
+
+Events are fanned out to the streams of this process by EventBroker. On
+PostgreSQL every commit also sends a NOTIFY in the same transaction and each
+process runs one LISTEN thread, so viewers connected to any worker see
+changes committed by all of them. On other databases events only reach
+streams served by the process that made the change.
+
+Only logists receive the stream. Every open stream holds a worker thread, so
+each process serves at most LIVE_STREAM_MAX_CONNECTIONS of them. Browsers
+beyond that get an empty stream telling them to reconnect after
+LIVE_STREAM_BUSY_RETRY seconds, and meanwhile the page just isn't live.
+"""
+import itertools
+import json
+import logging
+import queue
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from sqlalchemy import text
+
+from app import app, db
+from order_events import on_order_change
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'order_events'
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+
+
+def order_event(change):
+    """Public description of one committed order change; no customer details"""
+    event = {
+        'id': change.order_id,
+        'tracking_number': change.tracking_number,
+        'created': change.created,
+        'status': change.status,
+    }
+    if 'status' in change.changes:
+        event['old_status'] = change.changes['status'][0]
+    if 'price' in change.changes:
+        old, new = change.changes['price']
+        event['price'] = [None if old is None else float(old), None if new is None else float(new)]
+    return event
+
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.replay = []
+        self.resync = False  # the client missed events and should reload
+
+
+class EventBroker:
+    """Fans out event batches to the subscribed streams of this process"""
+
+    def __init__(self, history=200, queue_size=100, max_subscribers=None):
+        # Event ids carry a per-process token, so a reconnect that lands on
+        # another worker is detected and answered with a resync
+        self.token = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._counter = itertools.count(1)
+        self._history = deque(maxlen=history)  # (sequence, events)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, events):
+        with self._lock:
+            sequence = next(self._counter)
+            self._history.append((sequence, events))
+            for subscription in self._subscribers:
+                try:
+                    subscription.queue.put_nowait((sequence, events))
+                except queue.Full:
+                    subscription.resync = True
+
+    def subscribe(self, last_event_id=None):
+        """A new Subscription, or None when max_subscribers streams are already open"""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                return None
+            if last_event_id:
+                token, _, sequence = last_event_id.partition('-')
+                if token != self.token or not sequence.isdigit():
+                    subscription.resync = True
+                else:
+                    missed = [entry for entry in self._history if entry[0] > int(sequence)]
+                    if self._history and self._history[0][0] > int(sequence) + 1:
+                        subscription.resync = True
+                    subscription.replay = missed
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stream(self, subscription, max_duration, heartbeat):
+        """Generator of SSE frames; ends after max_duration and the browser reconnects"""
+        try:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + max_duration
+            pending = list(subscription.replay)
+            while time.monotonic() < deadline:
+                if subscription.resync:
+                    subscription.resync = False
+                    yield 'event: resync\ndata: {}\n\n'
+                if not pending:
+                    try:
+                        pending.append(subscription.queue.get(timeout=heartbeat))
+                    except queue.Empty:
+                        yield ': ping\n\n'
+                        continue
+                for sequence, events in pending:
+                    yield f"id: {self.token}-{sequence}\nevent: orders\ndata: {json.dumps(events)}\n\n"
+                pending = []
+        finally:
+            self.unsubscribe(subscription)
+
+
+class PostgresListener(threading.Thread):
+    """LISTENs for order events committed by any process and publishes them locally"""
+
+    def __init__(self, engine, broker):
+        super().__init__(name='order-events-listener', daemon=True)
+        self.engine = engine
+        self.broker = broker
+
+    def run(self):
+        while True:
+            connection = None
+            try:
+                # A dedicated connection, taken out of the pool for good
+                connection = self.engine.raw_connection()
+                connection.detach()
+                driver_connection = connection.driver_connection
+                driver_connection.autocommit = True
+                with driver_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while True:
+                    if select.select([driver_connection], [], [], 60) == ([], [], []):
+                        continue
+                    driver_connection.poll()
+                    while driver_connection.notifies:
+                        notification = driver_connection.notifies.pop(0)
+                        self.broker.publish(json.loads(notification.payload))
+            except Exception:
+                logger.exception("Order event listener failed; reconnecting")
+                time.sleep(5)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+broker = EventBroker(queue_size=app.config['LIVE_STREAM_QUEUE_SIZE'],
+                     max_subscribers=app.config['LIVE_STREAM_MAX_CONNECTIONS'])
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _uses_notify():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def subscribe(last_event_id=None):
+    """Subscribe the current request, or None when this process has no stream slot free.
+
+    Starts the LISTEN thread on first use.
+    """
+    global _listener
+    if _uses_notify() and _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = PostgresListener(db.engine, broker)
+                _listener.start()
+    return broker.subscribe(last_event_id)
+
+
+def stream(subscription):
+    return broker.stream(subscription,
+                         max_duration=app.config['LIVE_STREAM_MAX_DURATION'],
+                         heartbeat=app.config['LIVE_STREAM_HEARTBEAT'])
+
+
+@on_order_change()
+def notify_order_changes(session, changes):
+    if not _uses_notify():
+        return
+    payload = json.dumps([order_event(change) for change in changes])
+    if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+        # Large batches (bulk assignment) just tell viewers to refresh
+        payload = json.dumps([{'resync': True}])
+    # Delivered by PostgreSQL only if and when this transaction commits
+    session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                    {'channel': NOTIFY_CHANNEL, 'payload': payload})
+
+
+@on_order_change(after_commit=True)
+def publish_order_changes(changes):
+    if not _uses_notify():
+        broker.publish([order_event(change) for change in changes])
+
+
+def busy_stream():
+    """Answer for a browser turned away: no events, reconnect later"""
+    yield f"retry: {app.config['LIVE_STREAM_BUSY_RETRY'] * 1000}\n\n"
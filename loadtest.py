@@ -0,0 +1,113 @@
+"""Concurrency load test for the serving modes in gunicorn.conf.py.
+
+Runs a fixed number of concurrent clients against one URL for a while at
+each concurrency level and prints throughput and latency. To see what a
+worker class buys, start one worker of each kind and compare:
+
+    WEB_CONCURRENCY=1 GUNICORN_WORKER_CLASS=sync gunicorn main:app
+    WEB_CONCURRENCY=1 GUNICORN_WORKER_CLASS=gthread gunicorn main:app
+
+    python loadtest.py --longpoll HK2508130000017 --levels 1,4,16,32
+
+``--longpoll`` exercises the I/O-bound path: each request is an
+/api/track long-poll held for --wait seconds, so a sync worker completes
+about one request per wait period while a gthread worker completes about
+one per thread. Without it, --path is fetched as is (e.g. a tracking page).
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def fetch_etag(base, path):
+    connection = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=30)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    if response.status != 200:
+        raise SystemExit(f"GET {path} returned {response.status}")
+    return response.getheader('ETag')
+
+
+def client(base, path, headers, deadline, latencies, errors, lock):
+    connection = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=60)
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=60)
+            ok = False
+        elapsed = time.monotonic() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(elapsed)
+    connection.close()
+
+
+def run_level(base, path, headers, concurrency, duration):
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client, args=(base, path, headers, deadline, latencies, errors, lock))
+               for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base URL')
+    parser.add_argument('--path', default='/', help='path to request when not long-polling')
+    parser.add_argument('--longpoll', metavar='TRACKING_NUMBER', help='long-poll /api/track for this order')
+    parser.add_argument('--wait', type=int, default=2, help='long-poll wait in seconds')
+    parser.add_argument('--levels', default='1,4,16,32', help='comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per level')
+    args = parser.parse_args()
+
+    base = urlsplit(args.url)
+    headers = {}
+    path = args.path
+    if args.longpoll:
+        path = f"/api/track/{args.longpoll}"
+        # With the current ETag the server holds every request for the full wait
+        headers['If-None-Match'] = fetch_etag(base, path)
+        path += f"?wait={args.wait}"
+
+    print(f"GET {path}")
+    print(f"{'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for concurrency in (int(level) for level in args.levels.split(',')):
+        result = run_level(base, path, headers, concurrency, args.duration)
+        print(f"{result['concurrency']:>8} {result['requests']:>9} {result['errors']:>7} {result['rps']:>8.1f} "
+              f"{result['p50'] * 1000:>8.0f} {result['p95'] * 1000:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
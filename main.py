@@ -1,4 +1,5 @@
 from app import app
+import notification_worker  # registers 'flask notifications-worker'
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
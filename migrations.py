@@ -0,0 +1,415 @@
+"""Versioned schema migrations.
+
+Each migration is a (version, description, function) entry in MIGRATIONS and
+runs at most once per database; the applied version is kept in the
+``schema_version`` table. Functions receive an AUTOCOMMIT connection so that
+PostgreSQL index builds can use CREATE INDEX CONCURRENTLY against a live
+database without locking writes.
+
+Every worker runs upgrade() at startup. On PostgreSQL one of them takes an
+advisory lock and migrates while the others poll for it with
+pg_try_advisory_lock. They must not block in pg_advisory_lock instead: a
+blocked statement keeps its snapshot open, CREATE INDEX CONCURRENTLY waits
+for every open snapshot to finish, and the two would wait on each other.
+
+SQLite has no advisory locks, so app.py runs the whole startup (migrations,
+rollup backfill, default admin) inside startup_lock(), a file lock in the
+instance folder that lets the processes on one host set up one at a time.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from sqlalchemy import bindparam, func, inspect, text
+
+from app import app, db
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock so parallel workers don't migrate at once
+MIGRATION_LOCK_ID = 72_410_001
+MIGRATION_LOCK_POLL = 1  # seconds between attempts to take it
+
+
+def create_index_online(connection, index):
+    """Create an index without blocking writes where the database supports it"""
+    preparer = connection.dialect.identifier_preparer
+    columns = ', '.join(preparer.quote(column.name) for column in index.columns)
+    build_index_online(connection, index.name, f"{preparer.format_table(index.table)} ({columns})")
+
+
+def build_index_online(connection, name, target):
+    """CREATE INDEX <name> ON <target>, concurrently on PostgreSQL"""
+    quoted_name = connection.dialect.identifier_preparer.quote(name)
+    if connection.dialect.name == 'postgresql':
+        # A failed concurrent build leaves an INVALID index behind; rebuild it
+        invalid = connection.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            connection.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {quoted_name}")
+        connection.exec_driver_sql(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quoted_name} ON {target}")
+    else:
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {quoted_name} ON {target}")
+
+
+def backfill_in_batches(connection, table, statement, batch_size=5000):
+    """Run an UPDATE over id ranges, one short transaction per batch, to avoid long row locks"""
+    max_id = connection.exec_driver_sql(f"SELECT MAX(id) FROM {table}").scalar() or 0
+    for start in range(0, max_id + 1, batch_size):
+        connection.execute(text(statement), {'start': start, 'end': start + batch_size})
+
+
+def add_column(connection, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column exists (fresh databases get it from create_all)"""
+    existing = {info['name'] for info in inspect(connection).get_columns(table)}
+    if column not in existing:
+        preparer = connection.dialect.identifier_preparer
+        connection.exec_driver_sql(f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {preparer.quote(column)} {ddl}")
+
+
+def _create_indexes(connection, table, names):
+    indexes = {index.name: index for index in table.indexes}
+    for name in names:
+        create_index_online(connection, indexes[name])
+
+
+def _create_tables(connection, names):
+    db.metadata.create_all(connection, tables=[db.metadata.tables[name] for name in names])
+
+
+def baseline(connection):
+    """Tables as they existed before versioned migrations"""
+    _create_tables(connection, ['user', 'driver', 'order', 'order_daily_stat'])
+
+
+def order_access_indexes(connection):
+    from models import Order
+    _create_indexes(connection, Order.__table__, [
+        'ix_order_created_at_id',
+        'ix_order_status_created_at',
+        'ix_order_shipping_type_created_at',
+        'ix_order_customer_id_created_at',
+        'ix_order_driver_id_created_at',
+    ])
+
+
+def notification_outbox(connection):
+    _create_tables(connection, ['notification_outbox'])
+
+
+def order_audit_log(connection):
+    _create_tables(connection, ['order_audit_log'])
+
+
+def tracking_sequence(connection):
+    _create_tables(connection, ['tracking_sequence'])
+    connection.execute(text("INSERT INTO tracking_sequence (name, next_value) VALUES ('order', 1)"))
+
+
+# Digits of the customer phone as indexed for search (see search.py)
+PG_RAW_PHONE_DIGITS = "regexp_replace(NEW.customer_phone, '\\D', '', 'g')"
+PG_E164_PHONE_DIGITS = "coalesce(ltrim(NEW.customer_phone_e164, '+'), " + PG_RAW_PHONE_DIGITS + ")"
+SQLITE_RAW_PHONE_DIGITS = ("replace(replace(replace(replace(replace(replace({0}.customer_phone, "
+                           "'+', ''), ' ', ''), '-', ''), '(', ''), ')', ''), '.', '')")
+SQLITE_E164_PHONE_DIGITS = "coalesce(ltrim({0}.customer_phone_e164, '+'), " + SQLITE_RAW_PHONE_DIGITS + ")"
+
+
+def _pg_order_search_trigger(connection, phone_digits, phone_columns):
+    connection.exec_driver_sql(f"""
+        CREATE OR REPLACE FUNCTION order_search_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.customer_phone_digits := {phone_digits};
+            NEW.search_vector :=
+                setweight(to_tsvector('simple', coalesce(NEW.customer_name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(NEW.customer_phone_digits, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(NEW.pickup_address, '') || ' ' ||
+                                                coalesce(NEW.delivery_address, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(NEW.cargo_description, '')), 'C');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    connection.exec_driver_sql('DROP TRIGGER IF EXISTS order_search_update ON "order"')
+    connection.exec_driver_sql(
+        f'CREATE TRIGGER order_search_update BEFORE INSERT OR UPDATE OF customer_name, {phone_columns}, '
+        'pickup_address, delivery_address, cargo_description ON "order" '
+        'FOR EACH ROW EXECUTE FUNCTION order_search_update()'
+    )
+
+
+def _sqlite_order_search_triggers(connection, phone_digits, phone_columns):
+    """(Re)create the triggers keeping order_search in step with orders, and refill it"""
+    columns = "rowid, customer_name, customer_phone_digits, pickup_address, delivery_address, cargo_description"
+    values = ("{0}.id, {0}.customer_name, " + phone_digits + ", {0}.pickup_address, "
+              "{0}.delivery_address, {0}.cargo_description")
+    for trigger in ('order_search_insert', 'order_search_update', 'order_search_delete'):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    connection.exec_driver_sql(f"""
+        CREATE TRIGGER order_search_insert AFTER INSERT ON "order" BEGIN
+            INSERT INTO order_search ({columns}) VALUES ({values.format('new')});
+        END
+    """)
+    connection.exec_driver_sql(f"""
+        CREATE TRIGGER order_search_update AFTER UPDATE OF customer_name, {phone_columns},
+            pickup_address, delivery_address, cargo_description ON "order" BEGIN
+            DELETE FROM order_search WHERE rowid = old.id;
+            INSERT INTO order_search ({columns}) VALUES ({values.format('new')});
+        END
+    """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER order_search_delete AFTER DELETE ON "order" BEGIN
+            DELETE FROM order_search WHERE rowid = old.id;
+        END
+    """)
+    connection.exec_driver_sql("DELETE FROM order_search")
+    connection.exec_driver_sql(
+        f'INSERT INTO order_search ({columns}) SELECT {values.format(chr(34) + "order" + chr(34))} FROM "order"'
+    )
+
+
+def order_search_index(connection):
+    """Full-text search over orders; see search.py for the matching queries"""
+    if connection.dialect.name == 'postgresql':
+        try:
+            connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            has_trgm = True
+        except Exception:
+            logger.warning("pg_trgm is unavailable; phone fragment search will not be indexed")
+            has_trgm = False
+
+        # Plain nullable columns are added without rewriting the table
+        connection.exec_driver_sql('ALTER TABLE "order" ADD COLUMN IF NOT EXISTS search_vector tsvector')
+        connection.exec_driver_sql('ALTER TABLE "order" ADD COLUMN IF NOT EXISTS customer_phone_digits VARCHAR(20)')
+        _pg_order_search_trigger(connection, PG_RAW_PHONE_DIGITS, 'customer_phone')
+        backfill_in_batches(connection, '"order"',
+                            'UPDATE "order" SET customer_phone = customer_phone '
+                            'WHERE id >= :start AND id < :end AND search_vector IS NULL')
+        build_index_online(connection, 'ix_order_search_vector', '"order" USING gin (search_vector)')
+        if has_trgm:
+            build_index_online(connection, 'ix_order_customer_phone_digits_trgm',
+                               '"order" USING gin (customer_phone_digits gin_trgm_ops)')
+    elif connection.dialect.name == 'sqlite':
+        # FTS5 with the trigram tokenizer gives indexed substring matching
+        connection.exec_driver_sql("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS order_search USING fts5(
+                customer_name, customer_phone_digits, pickup_address, delivery_address, cargo_description,
+                tokenize = 'trigram'
+            )
+        """)
+        _sqlite_order_search_triggers(connection, SQLITE_RAW_PHONE_DIGITS, 'customer_phone')
+
+
+def _backfill_normalized_phone(connection, table, source, target, condition):
+    """Set target to normalize_phone(source) on matching rows, in id batches.
+
+    Normalization lives in Python, so the values are computed here.
+    """
+    from utils import normalize_phone
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            table.select().with_only_columns(table.c.id, table.c[source])
+            .where(table.c.id > last_id, condition)
+            .order_by(table.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        updates = [{'row_id': row_id, 'value': normalize_phone(phone)} for row_id, phone in rows]
+        updates = [update for update in updates if update['value']]
+        if updates:
+            connection.execute(
+                table.update().where(table.c.id == bindparam('row_id'))
+                .values({target: bindparam('value')}),
+                updates
+            )
+        last_id = rows[-1][0]
+
+
+def normalized_phone_columns(connection):
+    """E.164 copies of the phone columns, so phone lookups are indexed equality matches"""
+    from models import User, Driver, Order
+
+    targets = ((User.__table__, 'phone', 'phone_e164'),
+               (Driver.__table__, 'phone', 'phone_e164'),
+               (Order.__table__, 'customer_phone', 'customer_phone_e164'))
+    for table, source, target in targets:
+        add_column(connection, table.name, target, 'VARCHAR(16)')
+
+    for table, source, target in targets:
+        _backfill_normalized_phone(connection, table, source, target, table.c[target].is_(None))
+
+    _create_indexes(connection, User.__table__, ['ix_user_phone_e164'])
+    _create_indexes(connection, Driver.__table__, ['ix_driver_phone_e164'])
+    _create_indexes(connection, Order.__table__, ['ix_order_customer_phone_e164_created_at'])
+
+
+def order_status_history(connection):
+    """Status transition history, seeded from the status entries of the audit log"""
+    from models import Order, OrderAuditLog, OrderStatusTransition
+    _create_tables(connection, ['order_status_transition', 'order_lead_time_stat'])
+
+    audit, order = OrderAuditLog.__table__, Order.__table__
+    rows = connection.execute(
+        audit.select().with_only_columns(
+            audit.c.order_id, audit.c.old_value, audit.c.new_value, audit.c.created_at,
+            order.c.shipping_type, order.c.driver_id, order.c.created_at.label('order_created_at')
+        ).join(order, order.c.id == audit.c.order_id)
+        .where(audit.c.field == 'status', audit.c.new_value.isnot(None))
+        .order_by(audit.c.order_id, audit.c.created_at)
+    )
+    batch, previous_order, previous_at = [], None, None
+    for row in rows:
+        if row.order_id != previous_order:
+            previous_order = row.order_id
+            # Time in the first status is only known when that status was 'new'
+            previous_at = row.order_created_at if row.old_value == 'new' else None
+        batch.append({
+            'order_id': row.order_id, 'from_status': row.old_value, 'to_status': row.new_value,
+            'shipping_type': row.shipping_type, 'driver_id': row.driver_id,
+            'transitioned_at': row.created_at,
+            'seconds_in_previous': (row.created_at - previous_at).total_seconds() if previous_at else None,
+        })
+        previous_at = row.created_at
+        if len(batch) >= 1000:
+            connection.execute(OrderStatusTransition.__table__.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(OrderStatusTransition.__table__.insert(), batch)
+
+
+def order_updated_at_index(connection):
+    """MAX(updated_at) versions the cached admin fragments (see templating.py)"""
+    from models import Order
+    _create_indexes(connection, Order.__table__, ['ix_order_updated_at'])
+
+
+def order_status_changed_at(connection):
+    """When each order entered its current status, so a transition needs no lookup of the previous one"""
+    add_column(connection, 'order', 'status_changed_at', 'TIMESTAMP')
+    # Known from the history, or from creation for orders still new; otherwise left unknown
+    backfill_in_batches(connection, '"order"', """
+        UPDATE "order" SET status_changed_at = COALESCE(
+            (SELECT MAX(t.transitioned_at) FROM order_status_transition t WHERE t.order_id = "order".id),
+            CASE WHEN status = 'new' THEN created_at END
+        )
+        WHERE id >= :start AND id < :end AND status_changed_at IS NULL
+    """)
+
+
+def order_search_e164_phone(connection):
+    """Index the digits of the E.164 phone, so 8 701..., 7 701... and +7 701... all find the order"""
+    if connection.dialect.name == 'postgresql':
+        _pg_order_search_trigger(connection, PG_E164_PHONE_DIGITS, 'customer_phone, customer_phone_e164')
+        # Touching the row re-runs the trigger; the trigram index follows the column
+        backfill_in_batches(connection, '"order"',
+                            'UPDATE "order" SET customer_phone = customer_phone '
+                            "WHERE id >= :start AND id < :end AND customer_phone_e164 IS NOT NULL "
+                            "AND customer_phone_digits IS DISTINCT FROM ltrim(customer_phone_e164, '+')")
+    elif connection.dialect.name == 'sqlite':
+        _sqlite_order_search_triggers(connection, SQLITE_E164_PHONE_DIGITS, 'customer_phone, customer_phone_e164')
+
+
+def foreign_phones_renormalized(connection):
+    """+8... numbers were once read as 8 701... and stored as +7...; normalize them again"""
+    from models import User, Driver, Order
+    for table, source, target in ((User.__table__, 'phone', 'phone_e164'),
+                                  (Driver.__table__, 'phone', 'phone_e164'),
+                                  (Order.__table__, 'customer_phone', 'customer_phone_e164')):
+        condition = table.c[source].like('+%') & table.c[target].like('+7%') & \
+            ~func.replace(table.c[source], ' ', '').like('+7%')
+        _backfill_normalized_phone(connection, table, source, target, condition)
+
+
+def tracking_permutation_key(connection):
+    """Secret key for scrambling tracking number sequences; must never change afterwards"""
+    import secrets
+    add_column(connection, 'tracking_sequence', 'permutation_key', 'BIGINT')
+    connection.execute(
+        text("UPDATE tracking_sequence SET permutation_key = :key WHERE permutation_key IS NULL"),
+        {'key': secrets.randbits(62)}
+    )
+
+
+MIGRATIONS = [
+    (1, 'baseline tables', baseline),
+    (2, 'composite indexes for order listings and filters', order_access_indexes),
+    (3, 'notification outbox', notification_outbox),
+    (4, 'order audit log', order_audit_log),
+    (5, 'tracking number sequence', tracking_sequence),
+    (6, 'full-text search over orders', order_search_index),
+    (7, 'normalized E.164 phone columns', normalized_phone_columns),
+    (8, 'order status history', order_status_history),
+    (9, 'order updated_at index', order_updated_at_index),
+    (10, 'order status_changed_at', order_status_changed_at),
+    (11, 'search over E.164 phone digits', order_search_e164_phone),
+    (12, 'renormalize foreign +8 phone numbers', foreign_phones_renormalized),
+    (13, 'tracking number permutation key', tracking_permutation_key),
+]
+
+
+def current_version(connection):
+    connection.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    return connection.exec_driver_sql("SELECT MAX(version) FROM schema_version").scalar() or 0
+
+
+def acquire_migration_lock(connection):
+    """Take the advisory lock, polling so no statement holds a snapshot while waiting"""
+    waiting = False
+    while not connection.execute(text("SELECT pg_try_advisory_lock(:id)"), {'id': MIGRATION_LOCK_ID}).scalar():
+        if not waiting:
+            logger.info("Waiting for another process to finish migrating")
+            waiting = True
+        time.sleep(MIGRATION_LOCK_POLL)
+
+
+@contextmanager
+def startup_lock():
+    """Hold an exclusive lock on instance/startup.lock (a no-op where fcntl is missing)"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, 'startup.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def upgrade():
+    """Apply all pending migrations in order"""
+    engine = db.engine
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        is_postgres = connection.dialect.name == 'postgresql'
+        if is_postgres:
+            acquire_migration_lock(connection)
+        try:
+            version = current_version(connection)
+            for target, description, migrate in MIGRATIONS:
+                if target <= version:
+                    continue
+                logger.info("Applying migration %s: %s", target, description)
+                migrate(connection)
+                connection.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {'v': target})
+                version = target
+        finally:
+            if is_postgres:
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': MIGRATION_LOCK_ID})
+    return version
+
+
+@app.cli.command('db-upgrade')
+def upgrade_command():
+    """Apply pending schema migrations."""
+    version = upgrade()
+    print(f"Database schema is at version {version}")
@@ -2,6 +2,8 @@ from datetime import datetime
 from app import db
 from flask_login import UserMixin
 from sqlalchemy import Text
+from sqlalchemy.orm import validates
+from utils import normalize_phone, format_phone_number
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -9,23 +11,35 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     full_name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
+    phone_e164 = db.Column(db.String(16), index=True)  # normalized copy of phone, set on write
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), default='employee')  # employee, logist
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship to orders
     orders = db.relationship('Order', backref='customer', lazy=True, foreign_keys='Order.customer_id')
+    
+    @validates('phone')
+    def _normalize_phone(self, key, value):
+        self.phone_e164 = normalize_phone(value)
+        return value
 
 class Driver(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
+    phone_e164 = db.Column(db.String(16), index=True)  # normalized copy of phone, set on write
     vehicle_info = db.Column(db.String(200))
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship to orders
     orders = db.relationship('Order', backref='assigned_driver', lazy=True)
+    
+    @validates('phone')
+    def _normalize_phone(self, key, value):
+        self.phone_e164 = normalize_phone(value)
+        return value
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,6 +48,7 @@ class Order(db.Model):
     # Customer information
     customer_name = db.Column(db.String(100), nullable=False)
     customer_phone = db.Column(db.String(20), nullable=False)
+    customer_phone_e164 = db.Column(db.String(16))  # normalized copy of customer_phone, set on write
     customer_email = db.Column(db.String(120))
     customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # For registered users
     
@@ -61,6 +76,27 @@ class Order(db.Model):
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    status_changed_at = db.Column(db.DateTime, default=datetime.utcnow)  # set with every status change (see status_history.py)
+    
+    # Composite indexes for the listing filters in routes.py; existing
+    # databases receive them through migrations.py
+    __table_args__ = (
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        db.Index('ix_order_shipping_type_created_at', 'shipping_type', 'created_at'),
+        db.Index('ix_order_customer_id_created_at', 'customer_id', 'created_at'),
+        db.Index('ix_order_driver_id_created_at', 'driver_id', 'created_at'),
+        db.Index('ix_order_customer_phone_e164_created_at', 'customer_phone_e164', 'created_at'),
+        db.Index('ix_order_updated_at', 'updated_at'),
+    )
+    
+    @validates('customer_phone')
+    def _normalize_customer_phone(self, key, value):
+        self.customer_phone_e164 = normalize_phone(value)
+        return value
+    
+    def get_phone_display(self):
+        return format_phone_number(self.customer_phone_e164 or self.customer_phone)
     
     def get_status_display(self):
         status_map = {
@@ -78,3 +114,81 @@ class Order(db.Model):
             'kazakhstan': 'Отгрузка по Казахстану'
         }
         return type_map.get(self.shipping_type, self.shipping_type)
+
+class OrderDailyStat(db.Model):
+    """Daily order rollup per status, shipping type and driver, maintained by rollup.py"""
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(30), primary_key=True)
+    shipping_type = db.Column(db.String(20), primary_key=True)
+    driver_id = db.Column(db.Integer, primary_key=True, default=0)  # 0 = no driver assigned
+    
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    priced_count = db.Column(db.Integer, nullable=False, default=0)  # orders with a price, for averages
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class NotificationOutbox(db.Model):
+    """Outgoing notifications, written with the order and delivered by notification_worker.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(20), nullable=False, default='telegram')
+    recipient = db.Column(db.String(100))  # None = default chat for the channel
+    message = db.Column(Text, nullable=False)
+    
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(Text)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_notification_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class OrderAuditLog(db.Model):
+    """Field-level history of order edits, written by order_events.py in the edit's own commit"""
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    field = db.Column(db.String(50), nullable=False)
+    old_value = db.Column(db.String(200))
+    new_value = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_order_audit_log_order_id_created_at', 'order_id', 'created_at'),
+    )
+
+class OrderStatusTransition(db.Model):
+    """Append-only status history, written by status_history.py in the edit's own commit"""
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    from_status = db.Column(db.String(30))  # None when the order was created
+    to_status = db.Column(db.String(30), nullable=False)
+    shipping_type = db.Column(db.String(20), nullable=False)
+    driver_id = db.Column(db.Integer, nullable=True)
+    transitioned_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    seconds_in_previous = db.Column(db.Float)  # time spent in from_status, if known
+    
+    __table_args__ = (
+        db.Index('ix_order_status_transition_transitioned_at', 'transitioned_at'),
+        db.Index('ix_order_status_transition_to_status_transitioned_at', 'to_status', 'transitioned_at'),
+        db.Index('ix_order_status_transition_order_id_transitioned_at', 'order_id', 'transitioned_at'),
+    )
+
+class OrderLeadTimeStat(db.Model):
+    """Precomputed time-in-status percentiles, refreshed by status_history.py"""
+    metric = db.Column(db.String(30), primary_key=True)  # a status, or 'lead_time' for created -> delivered
+    shipping_type = db.Column(db.String(20), primary_key=True)
+    driver_id = db.Column(db.Integer, primary_key=True)  # 0 = all drivers
+    sample_count = db.Column(db.Integer, nullable=False)
+    p50_seconds = db.Column(db.Float, nullable=False)
+    p90_seconds = db.Column(db.Float, nullable=False)
+    p95_seconds = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+class TrackingSequence(db.Model):
+    """Counters handed out in blocks by tracking_numbers.py"""
+    name = db.Column(db.String(30), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)
+    permutation_key = db.Column(db.BigInteger)  # random, set once by migrations.py; scrambles the values
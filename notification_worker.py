@@ -0,0 +1,162 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import takewhile
+
+from app import app, db
+from models import NotificationOutbox
+from senders import get_sender, DeliveryError, RateLimited
+
+logger = logging.getLogger(__name__)
+
+STATISTICS_CHECK_INTERVAL = 60  # seconds
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2*base, 4*base, ... capped at the maximum"""
+    base = app.config['OUTBOX_BACKOFF_BASE']
+    return min(base * 2 ** (attempts - 1), app.config['OUTBOX_BACKOFF_MAX'])
+
+
+def _postpone(notifications, seconds):
+    """Push entries back without counting an attempt (rate limiting, not failure)"""
+    next_attempt_at = datetime.utcnow() + timedelta(seconds=seconds)
+    for notification in notifications:
+        notification.next_attempt_at = next_attempt_at
+
+
+def _record_failure(notifications, error):
+    for notification in notifications:
+        notification.attempts += 1
+        notification.last_error = str(error)
+        if getattr(error, 'permanent', False) or notification.attempts >= app.config['OUTBOX_MAX_ATTEMPTS']:
+            notification.status = 'failed'
+            logger.error("Giving up on notification %s after %s attempts: %s",
+                         notification.id, notification.attempts, error)
+        else:
+            notification.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(notification.attempts))
+
+
+def deliver_group(channel, recipient, notifications):
+    """Send the queued messages for one recipient as (at most) one outgoing message.
+
+    Messages that fit are coalesced into a digest; the rest wait for the
+    recipient's next send slot, so bursts never exceed the channel rate limit.
+    A message that failed before goes out on its own, so when the provider
+    rejects a digest only the message it can't take ends up failed.
+    """
+    try:
+        sender = get_sender(channel)
+    except DeliveryError as e:
+        _record_failure(notifications, e)
+        return
+
+    target = sender.resolve_recipient(recipient)
+    wait = sender.limiter.wait_time(target)
+    if wait > 0:
+        _postpone(notifications, wait)
+        return
+
+    if notifications[0].last_error:
+        count = 1
+    else:
+        count = sender.coalesce([n.message for n in takewhile(lambda n: not n.last_error, notifications)])
+    sending, waiting = notifications[:count], notifications[count:]
+
+    try:
+        sender.send(target, sender.format_digest([n.message for n in sending]))
+    except RateLimited as e:
+        sender.limiter.block(target, e.retry_after)
+        _postpone(notifications, e.retry_after)
+        return
+    except DeliveryError as e:
+        if e.permanent and len(sending) > 1:
+            # Don't know which message was rejected: retry them one at a time
+            for notification in sending:
+                notification.last_error = str(e)
+            _postpone(notifications, sender.min_interval)
+            return
+        _record_failure(sending, e)
+        _postpone(waiting, sender.min_interval)
+        return
+
+    sender.limiter.mark_sent(target)
+    now = datetime.utcnow()
+    for notification in sending:
+        notification.attempts += 1
+        notification.status = 'sent'
+        notification.sent_at = now
+        notification.last_error = None
+    _postpone(waiting, sender.min_interval)
+
+
+def drain_outbox(batch_size=None):
+    """Deliver one batch of due notifications, returning how many were processed.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several
+    workers can drain the same outbox on PostgreSQL without double sends.
+    """
+    batch_size = batch_size or app.config['OUTBOX_BATCH_SIZE']
+    now = datetime.utcnow()
+
+    batch = NotificationOutbox.query.filter(
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.next_attempt_at <= now
+    ).order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id).limit(
+        batch_size
+    ).with_for_update(skip_locked=True).all()
+
+    groups = defaultdict(list)
+    for notification in batch:
+        groups[(notification.channel, notification.recipient)].append(notification)
+
+    for (channel, recipient), notifications in groups.items():
+        deliver_group(channel, recipient, notifications)
+
+    db.session.commit()
+    return len(batch)
+
+
+def refresh_statistics():
+    """Keep the time-in-status percentiles fresh; a failure must not stop deliveries"""
+    from status_history import refresh_lead_time_stats_if_stale
+    try:
+        if refresh_lead_time_stats_if_stale():
+            logger.info("Refreshed time-in-status statistics")
+    except Exception:
+        logger.exception("Refreshing time-in-status statistics failed")
+        db.session.rollback()
+    finally:
+        db.session.remove()
+
+
+def run_worker(poll_interval=None):
+    """Drain the outbox forever, sleeping only when there is nothing due.
+
+    Between batches it also refreshes the lead-time statistics when they are
+    older than LEAD_TIME_REFRESH_INTERVAL (checked once a minute).
+    """
+    poll_interval = poll_interval or app.config['OUTBOX_POLL_INTERVAL']
+    logger.info("Notification worker started")
+    next_statistics_check = 0
+    while True:
+        if time.monotonic() >= next_statistics_check:
+            refresh_statistics()
+            next_statistics_check = time.monotonic() + STATISTICS_CHECK_INTERVAL
+        try:
+            processed = drain_outbox()
+        except Exception:
+            logger.exception("Notification worker batch failed")
+            db.session.rollback()
+            processed = 0
+        finally:
+            db.session.remove()
+        if not processed:
+            time.sleep(poll_interval)
+
+
+@app.cli.command('notifications-worker')
+def notifications_worker_command():
+    """Deliver queued notifications and refresh lead-time statistics until interrupted."""
+    run_worker()
@@ -0,0 +1,145 @@
+"""Change capture for orders.
+
+Field-level diffs of Order rows are collected from SQLAlchemy attribute history
+as the session flushes, merged per order, and dispatched once per commit:
+
+* in-transaction handlers run in ``before_commit`` and may add rows (audit log,
+  notification outbox) that are committed together with the edit;
+* after-commit handlers run once the data is durable and must not touch the
+  database (cache invalidation, push to live pages).
+
+Handlers receive a list of OrderChange objects and register with
+``@on_order_change()`` or ``@on_order_change(after_commit=True)``.
+"""
+import logging
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.orm import Session
+
+from models import Order, OrderAuditLog
+from pagination import invalidate_counts
+
+logger = logging.getLogger(__name__)
+
+TRACKED_FIELDS = ('status', 'price', 'driver_id')
+
+_in_transaction_handlers = []
+_after_commit_handlers = []
+
+
+class OrderChange:
+    """What happened to one order in a committed transaction"""
+
+    def __init__(self, order, created, changes):
+        self.order = order  # only safe to use from in-transaction handlers
+        self.order_id = order.id
+        self.tracking_number = order.tracking_number
+        self.created = created
+        self.changes = changes  # {field: (old, new)} for TRACKED_FIELDS, may be empty
+        # Current values, captured after the final flush so after-commit handlers can use them
+        self.status = order.status
+        self.driver_id = order.driver_id
+
+    def __repr__(self):
+        return f"<OrderChange {self.tracking_number} created={self.created} {self.changes}>"
+
+
+def on_order_change(after_commit=False):
+    """Register a handler for committed order changes"""
+    def decorator(handler):
+        (_after_commit_handlers if after_commit else _in_transaction_handlers).append(handler)
+        return handler
+    return decorator
+
+
+def record_created(session, orders):
+    """Announce orders inserted with a bulk INSERT, which skips flush events, as created"""
+    pending = session.info.setdefault('order_changes', {})
+    for order in orders:
+        pending.setdefault(order, {'created': True, 'changes': {}})
+
+
+@event.listens_for(Session, 'before_flush')
+def capture_order_changes(session, flush_context, instances):
+    pending = session.info.setdefault('order_changes', {})
+
+    for obj in session.new:
+        if isinstance(obj, Order):
+            pending.setdefault(obj, {'created': True, 'changes': {}})
+
+    for obj in session.dirty:
+        if not isinstance(obj, Order) or not session.is_modified(obj):
+            continue
+        # Any edit is recorded (caches depend on every column); diffs only for tracked fields
+        entry = pending.setdefault(obj, {'created': False, 'changes': {}})
+        state = inspect(obj)
+        for field in TRACKED_FIELDS:
+            history = state.attrs[field].history
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            # Keep the value from before the transaction across repeated flushes
+            first_old = entry['changes'].get(field, (old, None))[0]
+            if first_old == new:
+                entry['changes'].pop(field, None)
+            else:
+                entry['changes'][field] = (first_old, new)
+
+
+@event.listens_for(Session, 'before_commit')
+def dispatch_order_changes(session):
+    # before_commit runs ahead of commit's own flush; flush first so edits
+    # made since the last autoflush are captured and the diffs are final
+    session.flush()
+    pending = session.info.pop('order_changes', {})
+    changes = [OrderChange(order, entry['created'], entry['changes'])
+               for order, entry in pending.items()]
+    if not changes:
+        return
+
+    for handler in _in_transaction_handlers:
+        handler(session, changes)
+    session.info['committed_order_changes'] = changes
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_order_changes(session):
+    changes = session.info.pop('committed_order_changes', None)
+    if not changes:
+        return
+    for handler in _after_commit_handlers:
+        try:
+            handler(changes)
+        except Exception:
+            logger.exception("Order change handler %s failed", handler.__name__)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_order_changes(session):
+    session.info.pop('order_changes', None)
+    session.info.pop('committed_order_changes', None)
+
+
+@on_order_change()
+def write_audit_log(session, changes):
+    user_id = None
+    if has_request_context() and current_user.is_authenticated:
+        user_id = current_user.id
+
+    rows = [
+        {'order_id': change.order_id, 'user_id': user_id, 'field': field,
+         'old_value': None if old is None else str(old),
+         'new_value': None if new is None else str(new)}
+        for change in changes if not change.created
+        for field, (old, new) in change.changes.items()
+    ]
+    if rows:
+        # One executemany for every field of every order
+        session.execute(insert(OrderAuditLog), rows)
+
+
+@on_order_change(after_commit=True)
+def invalidate_order_counts(changes):
+    invalidate_counts()
@@ -0,0 +1,83 @@
+import base64
+import time
+from datetime import datetime
+from sqlalchemy import and_, or_, desc, asc
+
+# Per-process cache for listing totals: {key: (expires_at, count)}
+_count_cache = {}
+
+
+def encode_cursor(created_at, order_id):
+    """Encode a (created_at, id) position into an opaque URL-safe cursor"""
+    raw = f"{created_at.isoformat()}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, returning None if malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, order_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(query, created_col, id_col, page_size, after=None, before=None):
+    """Fetch one page of a newest-first listing using keyset pagination.
+
+    Rows are ordered by (created_at DESC, id DESC). ``after`` continues towards
+    older rows, ``before`` goes back towards newer ones. Only ``page_size + 1``
+    rows are ever read, so every page costs the same regardless of its depth.
+
+    Returns (rows, next_cursor, prev_cursor).
+    """
+    after_pos = decode_cursor(after)
+    before_pos = decode_cursor(before)
+
+    if before_pos and not after_pos:
+        ts, row_id = before_pos
+        query = query.filter(or_(created_col > ts, and_(created_col == ts, id_col > row_id)))
+        rows = query.order_by(asc(created_col), asc(id_col)).limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        rows = list(reversed(rows[:page_size]))
+        has_newer, has_older = has_more, True
+    else:
+        if after_pos:
+            ts, row_id = after_pos
+            query = query.filter(or_(created_col < ts, and_(created_col == ts, id_col < row_id)))
+        rows = query.order_by(desc(created_col), desc(id_col)).limit(page_size + 1).all()
+        has_older = len(rows) > page_size
+        rows = rows[:page_size]
+        has_newer = after_pos is not None
+
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if rows and has_older else None
+    prev_cursor = encode_cursor(rows[0].created_at, rows[0].id) if rows and has_newer else None
+    return rows, next_cursor, prev_cursor
+
+
+def cached_count(key, query, ttl=60):
+    """Return query.count(), reusing the result for ``ttl`` seconds per key"""
+    now = time.monotonic()
+    entry = _count_cache.get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    count = query.order_by(None).count()
+    _count_cache[key] = (now + ttl, count)
+
+    # Keep the cache bounded; filter combinations are user-controlled
+    if len(_count_cache) > 1024:
+        for stale_key in [k for k, (exp, _) in _count_cache.items() if exp <= now]:
+            _count_cache.pop(stale_key, None)
+        if len(_count_cache) > 1024:
+            _count_cache.clear()
+    return count
+
+
+def invalidate_counts():
+    """Drop cached totals, e.g. after orders were created or changed status"""
+    _count_cache.clear()
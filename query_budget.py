@@ -0,0 +1,49 @@
+import logging
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in testing mode when a view issues more queries than it declared"""
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL queries a view may issue per request.
+
+    The budget includes the Flask-Login user lookup, so it reflects what the
+    database actually sees for one page view.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def init_query_budget(app):
+    """Check declared budgets after each request in debug and testing mode"""
+
+    @app.after_request
+    def check_query_budget(response):
+        if not (app.debug or app.testing):
+            return response
+
+        count = g.get('query_count', 0)
+        response.headers['X-Query-Count'] = str(count)
+
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and count > budget:
+            message = f"{request.endpoint} issued {count} queries, budget is {budget}"
+            if app.testing:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
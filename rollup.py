@@ -0,0 +1,154 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, inspect, func, select, delete, insert, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import app, db
+from models import Order, OrderDailyStat
+
+ROLLUP_FIELDS = ('created_at', 'status', 'shipping_type', 'driver_id', 'price')
+
+
+def _order_values(order, committed):
+    """Rollup-relevant values of an order, either as last flushed or as pending"""
+    state = inspect(order)
+    values = {}
+    for name in ROLLUP_FIELDS:
+        history = state.attrs[name].history
+        if history.added or history.deleted:
+            changed = history.deleted if committed else history.added
+            values[name] = changed[0] if changed else None
+        else:
+            # Unmodified; loads the column if it was deferred or expired
+            values[name] = getattr(order, name)
+    return values
+
+
+def _rollup_key(values):
+    created_at = values['created_at'] or datetime.utcnow()
+    return (created_at.date(), values['status'] or 'new', values['shipping_type'], values['driver_id'] or 0)
+
+
+def _add_delta(deltas, values, sign):
+    delta = deltas[_rollup_key(values)]
+    delta[0] += sign
+    if values['price'] is not None:
+        delta[1] += sign
+        delta[2] += sign * values['price']
+
+
+@event.listens_for(Session, 'before_flush')
+def track_order_changes(session, flush_context, instances):
+    """Fold pending Order inserts, edits and deletes into the daily rollup.
+
+    The rollup rows are upserted on the session's own connection, so they
+    commit or roll back together with the orders that caused them.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+
+    for obj in session.new:
+        if isinstance(obj, Order):
+            _add_delta(deltas, _order_values(obj, committed=False), 1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Order) and session.is_modified(obj):
+            old_values = _order_values(obj, committed=True)
+            new_values = _order_values(obj, committed=False)
+            if old_values != new_values:
+                _add_delta(deltas, old_values, -1)
+                _add_delta(deltas, new_values, 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            _add_delta(deltas, _order_values(obj, committed=True), -1)
+
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+
+def record_bulk_insert(connection, rows):
+    """Fold orders inserted with a bulk INSERT, which skips flush events, into the rollup"""
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    for row in rows:
+        _add_delta(deltas, {field: row.get(field) for field in ROLLUP_FIELDS}, 1)
+    _apply_deltas(connection, deltas)
+
+
+def _apply_deltas(connection, deltas):
+    """Atomically add deltas to the rollup rows, creating them if needed"""
+    table = OrderDailyStat.__table__
+    rows = [
+        dict(day=day, status=status, shipping_type=shipping_type, driver_id=driver_id,
+             order_count=count, priced_count=priced, revenue=revenue)
+        for (day, status, shipping_type, driver_id), (count, priced, revenue) in deltas.items()
+        if count or priced or revenue
+    ]
+    if not rows:
+        return
+
+    dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(connection.dialect.name)
+    if dialect_insert is not None:
+        # One executemany covers the old and the new bucket of an edit
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.status, table.c.shipping_type, table.c.driver_id],
+            set_={
+                'order_count': table.c.order_count + stmt.excluded.order_count,
+                'priced_count': table.c.priced_count + stmt.excluded.priced_count,
+                'revenue': table.c.revenue + stmt.excluded.revenue,
+            }
+        )
+        connection.execute(stmt, rows)
+        return
+
+    # Generic fallback for databases without ON CONFLICT
+    for row in rows:
+        result = connection.execute(
+            update(table).where(
+                table.c.day == row['day'], table.c.status == row['status'],
+                table.c.shipping_type == row['shipping_type'], table.c.driver_id == row['driver_id']
+            ).values(
+                order_count=table.c.order_count + row['order_count'],
+                priced_count=table.c.priced_count + row['priced_count'],
+                revenue=table.c.revenue + row['revenue']
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+
+def rebuild_daily_rollup():
+    """Recompute the whole rollup table from the orders table in one transaction"""
+    table = OrderDailyStat.__table__
+    day = func.date(Order.created_at)
+    select_stmt = select(
+        day,
+        func.coalesce(Order.status, 'new'),
+        Order.shipping_type,
+        func.coalesce(Order.driver_id, 0),
+        func.count(Order.id),
+        func.count(Order.price),
+        func.coalesce(func.sum(Order.price), 0)
+    ).group_by(day, func.coalesce(Order.status, 'new'), Order.shipping_type, func.coalesce(Order.driver_id, 0))
+
+    db.session.execute(delete(table))
+    db.session.execute(insert(table).from_select(
+        ['day', 'status', 'shipping_type', 'driver_id', 'order_count', 'priced_count', 'revenue'],
+        select_stmt
+    ))
+    db.session.commit()
+
+
+def ensure_daily_rollup():
+    """Backfill the rollup on first start against a database that already has orders"""
+    has_rollup = db.session.query(OrderDailyStat.day).limit(1).first() is not None
+    if not has_rollup and db.session.query(Order.id).limit(1).first() is not None:
+        rebuild_daily_rollup()
+
+
+@app.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """Rebuild the daily analytics rollup from scratch."""
+    rebuild_daily_rollup()
+    print("Daily analytics rollup rebuilt")
@@ -1,15 +1,47 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc, and_
-import json
+import hmac
+import time
+from sqlalchemy import func, desc, or_, case, select
+from sqlalchemy.orm import joinedload, load_only
 
 from app import app, db
-from models import User, Order, Driver
-from forms import OrderForm, TrackingForm, RegistrationForm, LoginForm, OrderEditForm, DriverForm
-from utils import generate_tracking_number, send_telegram_notification
-from telegram_bot import send_order_notification
+from models import User, Order, Driver, OrderDailyStat, OrderLeadTimeStat
+from forms import OrderForm, TrackingForm, RegistrationForm, LoginForm, OrderEditForm, DriverForm, DispatchForm
+from utils import normalize_phone, format_duration
+from tracking_numbers import generate_tracking_number, normalize_tracking_number, is_valid_tracking_number
+import telegram_bot  # queues notifications for committed order changes
+from pagination import keyset_page, cached_count
+from query_budget import query_budget
+from db_routing import replica_reads
+from templating import Deferred, stream_page
+from bulk_orders import import_orders, iter_csv_rows, iter_xlsx_rows, export_orders_csv, IMPORT_FIELDS
+from search import search_orders
+import dispatch
+import routing
+import live_updates
+import instrumentation
+import status_history  # records status transitions for time-in-status analytics
+from tracking_cache import get_tracking_view, get_tracking_data, tracking_etag, tracking_payload, wait_for_tracking_change
+
+# Columns rendered by order listings; Text columns such as cargo_description
+# and internal_comments are left unloaded on list pages
+ORDER_LIST_COLUMNS = (
+    Order.id, Order.tracking_number, Order.customer_name, Order.customer_phone,
+    Order.customer_phone_e164, Order.customer_email, Order.customer_id, Order.shipping_type, Order.status,
+    Order.price, Order.driver_id, Order.created_at,
+)
+
+app.add_template_filter(format_duration, 'duration')
+
+def order_list_options(*extra_columns):
+    """Loader options for order listings: projected columns plus the driver in one JOIN"""
+    return (
+        load_only(*ORDER_LIST_COLUMNS, *extra_columns),
+        joinedload(Order.assigned_driver).load_only(Driver.id, Driver.name, Driver.phone),
+    )
 
 @app.route('/')
 def index():
@@ -49,12 +81,10 @@ def create_order(shipping_type):
         if current_user.is_authenticated:
             order.customer_id = current_user.id
         
+        # The Telegram notification is queued in the same commit (see telegram_bot.py)
         db.session.add(order)
         db.session.commit()
         
-        # Send Telegram notification
-        send_order_notification(order)
-        
         flash(f'Ваша заявка принята! Номер отслеживания: {tracking_number}', 'success')
         return redirect(url_for('track_order', tracking_number=tracking_number))
     
@@ -63,22 +93,62 @@ def create_order(shipping_type):
 
 @app.route('/track')
 @app.route('/track/<tracking_number>')
+@query_budget(2)
+@replica_reads
 def track_order(tracking_number=None):
     form = TrackingForm()
     order = None
     
     if tracking_number:
-        order = Order.query.filter_by(tracking_number=tracking_number).first()
+        # Malformed numbers never reach the cache or the database
+        tracking_number = normalize_tracking_number(tracking_number)
+        order = get_tracking_view(tracking_number) if is_valid_tracking_number(tracking_number) else None
         if not order:
             flash('Заказ с указанным номером не найден', 'error')
     
     return render_template('track_order.html', form=form, order=order, tracking_number=tracking_number)
 
+@app.route('/api/track/<tracking_number>')
+@query_budget(3)
+def api_track_order(tracking_number):
+    """JSON tracking status with ETag support.
+
+    Clients send the last ETag in If-None-Match and get 304 while nothing
+    changed. With ?wait=<seconds> the request is held until the order changes
+    or the wait expires (long polling).
+    """
+    tracking_number = normalize_tracking_number(tracking_number)
+    data = get_tracking_data(tracking_number) if is_valid_tracking_number(tracking_number) else None
+    if data is None:
+        return jsonify({'error': 'Order not found'}), 404
+    
+    etag = tracking_etag(data)
+    wait = max(0, min(request.args.get('wait', 0, type=int), app.config['TRACKING_LONGPOLL_MAX']))
+    if wait and request.if_none_match.contains(etag):
+        # Don't hold a pooled connection while waiting
+        db.session.close()
+        deadline = time.monotonic() + wait
+        while request.if_none_match.contains(etag):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Changes committed by other processes are picked up on the periodic recheck
+            wait_for_tracking_change(min(remaining, app.config['TRACKING_LONGPOLL_RECHECK']))
+            data = get_tracking_data(tracking_number)
+            if data is None:
+                return jsonify({'error': 'Order not found'}), 404
+            etag = tracking_etag(data)
+    
+    response = jsonify(tracking_payload(data))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/track_search', methods=['POST'])
 def track_search():
     form = TrackingForm()
     if form.validate_on_submit():
-        return redirect(url_for('track_order', tracking_number=form.tracking_number.data))
+        return redirect(url_for('track_order', tracking_number=normalize_tracking_number(form.tracking_number.data)))
     return redirect(url_for('track_order'))
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -149,45 +219,55 @@ def logout():
 
 @app.route('/profile')
 @login_required
+@query_budget(2)
 def profile():
     # Get user's orders
-    orders = Order.query.filter_by(customer_id=current_user.id).order_by(desc(Order.created_at)).all()
+    orders = Order.query.options(load_only(*ORDER_LIST_COLUMNS)).filter_by(
+        customer_id=current_user.id
+    ).order_by(desc(Order.created_at)).all()
     return render_template('profile.html', orders=orders)
 
 # Admin routes
 @app.route('/admin')
 @login_required
+@query_budget(4)
+@replica_reads
 def admin_dashboard():
-    # Get basic statistics
-    total_orders = Order.query.count()
-    new_orders = Order.query.filter_by(status='new').count()
-    in_progress_orders = Order.query.filter_by(status='in_progress').count()
-    delivered_orders = Order.query.filter_by(status='delivered').count()
+    # Queried only when the cached fragments are stale (see templating.py)
+    return render_template('admin/dashboard.html', dashboard=Deferred(dashboard_data))
+
+def dashboard_data():
+    """Figures and recent orders for the dashboard"""
+    # Status counts and revenue statistics in a single pass over the table
+    stats = db.session.query(
+        func.count(Order.id).label('total_orders'),
+        func.count(case((Order.status == 'new', 1))).label('new_orders'),
+        func.count(case((Order.status == 'in_progress', 1))).label('in_progress_orders'),
+        func.count(case((Order.status == 'delivered', 1))).label('delivered_orders'),
+        func.sum(Order.price).label('total_revenue'),
+        func.avg(Order.price).label('avg_order_value')
+    ).one()
     
     # Recent orders
-    recent_orders = Order.query.order_by(desc(Order.created_at)).limit(10).all()
-    
-    # Revenue statistics
-    total_revenue = db.session.query(func.sum(Order.price)).filter(Order.price.isnot(None)).scalar() or 0
-    avg_order_value = db.session.query(func.avg(Order.price)).filter(Order.price.isnot(None)).scalar() or 0
-    
-    return render_template('admin/dashboard.html',
-                         total_orders=total_orders,
-                         new_orders=new_orders,
-                         in_progress_orders=in_progress_orders,
-                         delivered_orders=delivered_orders,
-                         recent_orders=recent_orders,
-                         total_revenue=total_revenue,
-                         avg_order_value=avg_order_value)
+    recent_orders = Order.query.options(load_only(*ORDER_LIST_COLUMNS)).order_by(
+        desc(Order.created_at)
+    ).limit(10).all()
+    
+    return dict(total_orders=stats.total_orders,
+                new_orders=stats.new_orders,
+                in_progress_orders=stats.in_progress_orders,
+                delivered_orders=stats.delivered_orders,
+                recent_orders=recent_orders,
+                total_revenue=stats.total_revenue or 0,
+                avg_order_value=stats.avg_order_value or 0)
 
-@app.route('/admin/orders')
-@login_required
-def admin_orders():
-    # Filter parameters
+def filtered_orders_query():
+    """Order query for the admin listing filters in request.args, limited by role"""
     status_filter = request.args.get('status', '')
     shipping_type_filter = request.args.get('shipping_type', '')
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
+    phone_filter = request.args.get('phone', '')
     
     # Build query
     query = Order.query
@@ -216,16 +296,137 @@ def admin_orders():
         except ValueError:
             pass
     
-    orders = query.order_by(desc(Order.created_at)).all()
+    if phone_filter:
+        # Exact match on the indexed E.164 columns: the order's contact phone or the customer's account phone
+        phone = normalize_phone(phone_filter)
+        query = query.filter(or_(
+            Order.customer_phone_e164 == phone,
+            Order.customer_id.in_(select(User.id).where(User.phone_e164 == phone))
+        ) if phone else False)
     
-    return render_template('admin/orders.html', orders=orders,
+    return query
+
+@app.route('/admin/orders')
+@login_required
+@query_budget(3)
+def admin_orders():
+    # Filter parameters
+    status_filter = request.args.get('status', '')
+    shipping_type_filter = request.args.get('shipping_type', '')
+    date_from = request.args.get('date_from', '')
+    date_to = request.args.get('date_to', '')
+    phone_filter = request.args.get('phone', '')
+    search_query = request.args.get('q', '').strip()
+    
+    query = filtered_orders_query()
+    list_options = order_list_options(Order.pickup_address, Order.delivery_address)
+    
+    # Page size is configurable per request but capped to keep pages cheap
+    page_size = request.args.get('per_page', app.config['ORDERS_PAGE_SIZE'], type=int)
+    page_size = max(1, min(page_size, app.config['ORDERS_MAX_PAGE_SIZE']))
+    
+    filter_args = {k: v for k, v in {
+        'q': search_query,
+        'status': status_filter,
+        'shipping_type': shipping_type_filter,
+        'date_from': date_from,
+        'date_to': date_to,
+        'phone': phone_filter,
+        'per_page': request.args.get('per_page', ''),
+    }.items() if v}
+    
+    next_cursor = prev_cursor = None
+    search_page = None
+    has_more = False
+    
+    if search_query:
+        # Ranked search results are paged by offset; relevance has no stable keyset
+        search_page = max(1, min(request.args.get('page', 1, type=int), app.config['SEARCH_MAX_PAGES']))
+        rows = search_orders(query, search_query, db.engine.dialect.name).options(*list_options).offset(
+            (search_page - 1) * page_size
+        ).limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        orders = rows[:page_size]
+        total_count = None
+    else:
+        # Totals are cached briefly per filter combination instead of counted on every page
+        count_key = (current_user.id if current_user.role == 'employee' else None,
+                     status_filter, shipping_type_filter, date_from, date_to, phone_filter)
+        total_count = cached_count(count_key, query, ttl=app.config['ORDERS_COUNT_CACHE_TTL'])
+        
+        orders, next_cursor, prev_cursor = keyset_page(
+            query.options(*list_options),
+            Order.created_at, Order.id, page_size,
+            after=request.args.get('after'),
+            before=request.args.get('before')
+        )
+    
+    # Up to ORDERS_MAX_PAGE_SIZE rows; the page head goes out while the rows render
+    return stream_page('admin/orders.html', orders=orders,
+                         total_count=total_count,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
+                         search_query=search_query,
+                         search_page=search_page,
+                         has_more=has_more,
+                         filter_args=filter_args,
                          status_filter=status_filter,
                          shipping_type_filter=shipping_type_filter,
                          date_from=date_from,
-                         date_to=date_to)
+                         date_to=date_to,
+                         phone_filter=phone_filter)
+
+@app.route('/admin/orders/export.csv')
+@login_required
+@replica_reads
+def export_orders():
+    """Stream the orders matching the current listing filters as CSV"""
+    query = filtered_orders_query()
+    search_query = request.args.get('q', '').strip()
+    if search_query:
+        query = search_orders(query, search_query, db.engine.dialect.name)
+    
+    filename = f"orders_{datetime.utcnow().strftime('%Y%m%d_%H%M')}.csv"
+    return Response(
+        stream_with_context(export_orders_csv(query)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/admin/orders/import', methods=['GET', 'POST'])
+@login_required
+def import_orders_view():
+    if current_user.role != 'logist':
+        flash('У вас нет прав для импорта заказов', 'error')
+        return redirect(url_for('admin_orders'))
+    
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Выберите файл для импорта', 'error')
+            return redirect(url_for('import_orders_view'))
+        
+        try:
+            if upload.filename.lower().endswith('.xlsx'):
+                rows = iter_xlsx_rows(upload.stream)
+            else:
+                rows = iter_csv_rows(upload.stream)
+            result = import_orders(rows)
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(f'Не удалось прочитать файл: {e}', 'error')
+            return redirect(url_for('import_orders_view'))
+        
+        if result.imported:
+            flash(f'Импортировано заказов: {result.imported}', 'success')
+        if result.failed:
+            flash(f'Строк с ошибками: {result.failed}', 'warning')
+    
+    return render_template('admin/import_orders.html', result=result, import_fields=IMPORT_FIELDS)
 
 @app.route('/admin/orders/<int:order_id>/edit', methods=['GET', 'POST'])
 @login_required
+@query_budget(10)
 def edit_order(order_id):
     order = Order.query.get_or_404(order_id)
     
@@ -236,9 +437,8 @@ def edit_order(order_id):
     
     form = OrderEditForm()
     
-    # Populate driver choices
-    drivers = Driver.query.filter_by(is_active=True).all()
-    form.driver_id.choices = [(0, 'Не назначен')] + [(d.id, f'{d.name} ({d.phone})') for d in drivers]
+    # Driver choices come from the dispatch board, least loaded first
+    form.driver_id.choices = dispatch.driver_choices()
     
     if form.validate_on_submit():
         # Update order fields based on user role
@@ -276,91 +476,123 @@ def edit_order(order_id):
     
     return render_template('admin/edit_order.html', form=form, order=order)
 
+def analytics_range():
+    """Analytics window from the ?days= argument (30 by default, up to a year)"""
+    days = request.args.get('days', 30, type=int)
+    days = max(1, min(days, 366))
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+    return days, start_date, end_date
+
 @app.route('/admin/analytics')
 @login_required
+@query_budget(7)
+@replica_reads
 def analytics():
     if current_user.role != 'logist':
         flash('У вас нет доступа к аналитике', 'error')
         return redirect(url_for('admin_dashboard'))
     
     # Date range for analytics (last 30 days by default)
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=30)
+    days, start_date, end_date = analytics_range()
+    
+    # Queried only when the cached fragments are stale (see templating.py)
+    return render_template('admin/analytics.html',
+                         report=Deferred(analytics_report, start_date),
+                         days=days,
+                         start_date=start_date,
+                         end_date=end_date)
+
+def analytics_report(start_date):
+    """Aggregates for the analytics page, from the daily rollup and lead-time tables"""
+    in_range = OrderDailyStat.day >= start_date.date()
     
     # Orders by status
     status_stats = db.session.query(
-        Order.status,
-        func.count(Order.id).label('count')
-    ).filter(Order.created_at >= start_date).group_by(Order.status).all()
+        OrderDailyStat.status,
+        func.sum(OrderDailyStat.order_count).label('count')
+    ).filter(in_range).group_by(OrderDailyStat.status).all()
     
     # Orders by shipping type
     shipping_stats = db.session.query(
-        Order.shipping_type,
-        func.count(Order.id).label('count'),
-        func.sum(Order.price).label('revenue')
-    ).filter(Order.created_at >= start_date).group_by(Order.shipping_type).all()
+        OrderDailyStat.shipping_type,
+        func.sum(OrderDailyStat.order_count).label('count'),
+        func.sum(OrderDailyStat.revenue).label('revenue'),
+        func.sum(OrderDailyStat.priced_count).label('priced_count')
+    ).filter(in_range).group_by(OrderDailyStat.shipping_type).all()
     
-    # Daily orders for the last 30 days
+    # Daily orders for the selected period
     daily_orders = db.session.query(
-        func.date(Order.created_at).label('date'),
-        func.count(Order.id).label('count'),
-        func.sum(Order.price).label('revenue')
-    ).filter(Order.created_at >= start_date).group_by(func.date(Order.created_at)).all()
+        OrderDailyStat.day.label('date'),
+        func.sum(OrderDailyStat.order_count).label('count'),
+        func.sum(OrderDailyStat.revenue).label('revenue')
+    ).filter(in_range).group_by(OrderDailyStat.day).order_by(OrderDailyStat.day).all()
     
     # Driver performance
     driver_stats = db.session.query(
         Driver.name,
-        func.count(Order.id).label('orders_count'),
-        func.sum(Order.price).label('total_revenue')
-    ).join(Order, Driver.id == Order.driver_id).filter(
-        Order.created_at >= start_date
+        func.sum(OrderDailyStat.order_count).label('orders_count'),
+        func.sum(OrderDailyStat.revenue).label('total_revenue'),
+        Driver.id
+    ).join(OrderDailyStat, Driver.id == OrderDailyStat.driver_id).filter(
+        in_range
     ).group_by(Driver.id, Driver.name).all()
     
-    # Cost analysis
-    total_revenue = db.session.query(func.sum(Order.price)).filter(
-        and_(Order.created_at >= start_date, Order.price.isnot(None))
-    ).scalar() or 0
-    
-    avg_order_value = db.session.query(func.avg(Order.price)).filter(
-        and_(Order.created_at >= start_date, Order.price.isnot(None))
-    ).scalar() or 0
-    
-    total_orders = Order.query.filter(Order.created_at >= start_date).count()
-    
-    return render_template('admin/analytics.html',
-                         status_stats=status_stats,
-                         shipping_stats=shipping_stats,
-                         daily_orders=daily_orders,
-                         driver_stats=driver_stats,
-                         total_revenue=total_revenue,
-                         avg_order_value=avg_order_value,
-                         total_orders=total_orders,
-                         start_date=start_date,
-                         end_date=end_date)
+    # Time-in-status percentiles, precomputed by status_history.refresh_lead_time_stats
+    lead_times = {}
+    driver_lead_times = {}
+    lead_times_computed_at = None
+    for row in OrderLeadTimeStat.query.all():
+        if row.driver_id:
+            if row.metric == status_history.LEAD_TIME:
+                driver_lead_times.setdefault(row.driver_id, {})[row.shipping_type] = row
+        else:
+            lead_times[(row.metric, row.shipping_type)] = row
+        lead_times_computed_at = row.computed_at
+    
+    # Cost analysis, derived from the per-shipping-type totals
+    total_orders = sum(row.count for row in shipping_stats)
+    total_revenue = sum(row.revenue or 0 for row in shipping_stats)
+    priced_orders = sum(row.priced_count for row in shipping_stats)
+    avg_order_value = total_revenue / priced_orders if priced_orders else 0
+    shipping_stats = [(row.shipping_type, row.count, row.revenue) for row in shipping_stats]
+    
+    return dict(status_stats=status_stats,
+                shipping_stats=shipping_stats,
+                daily_orders=daily_orders,
+                driver_stats=driver_stats,
+                lead_times=lead_times,
+                driver_lead_times=driver_lead_times,
+                lead_times_computed_at=lead_times_computed_at,
+                total_revenue=total_revenue,
+                avg_order_value=avg_order_value,
+                total_orders=total_orders)
 
 @app.route('/admin/analytics/data')
 @login_required
+@query_budget(3)
+@replica_reads
 def analytics_data():
     """API endpoint for chart data"""
     if current_user.role != 'logist':
         return jsonify({'error': 'Access denied'}), 403
     
     # Get data for charts
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=30)
+    days, start_date, end_date = analytics_range()
+    in_range = OrderDailyStat.day >= start_date.date()
     
     # Daily orders data
     daily_data = db.session.query(
-        func.date(Order.created_at).label('date'),
-        func.count(Order.id).label('orders'),
-        func.coalesce(func.sum(Order.price), 0).label('revenue')
-    ).filter(Order.created_at >= start_date).group_by(func.date(Order.created_at)).all()
+        OrderDailyStat.day.label('date'),
+        func.sum(OrderDailyStat.order_count).label('orders'),
+        func.coalesce(func.sum(OrderDailyStat.revenue), 0).label('revenue')
+    ).filter(in_range).group_by(OrderDailyStat.day).order_by(OrderDailyStat.day).all()
     
     # Status distribution
     status_data = db.session.query(
-        Order.status,
-        func.count(Order.id).label('count')
-    ).filter(Order.created_at >= start_date).group_by(Order.status).all()
+        OrderDailyStat.status,
+        func.sum(OrderDailyStat.order_count).label('count')
+    ).filter(in_range).group_by(OrderDailyStat.status).all()
     
     return jsonify({
         'daily_orders': [
@@ -374,7 +606,7 @@ def analytics_data():
             {
                 'status': row.status,
                 'count': row.count,
-                'label': Order().get_status_display() if hasattr(Order(), 'get_status_display') else row.status
+                'label': Order(status=row.status).get_status_display()
             } for row in status_data
         ]
     })
@@ -408,12 +640,70 @@ def add_driver():
         
         db.session.add(driver)
         db.session.commit()
+        dispatch.board.invalidate()
         
         flash('Водитель успешно добавлен!', 'success')
         return redirect(url_for('admin_drivers'))
     
     return render_template('admin/edit_driver.html', form=form, driver=None)
 
+@app.route('/admin/dispatch', methods=['GET', 'POST'])
+@login_required
+def dispatch_board():
+    if current_user.role != 'logist':
+        flash('У вас нет доступа к диспетчерской', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    form = DispatchForm()
+    
+    if form.validate_on_submit():
+        count = min(form.count.data, app.config['DISPATCH_MAX_BATCH'])
+        assignments = dispatch.assign_new_orders(count)
+        if assignments:
+            flash(f'Назначено заказов: {len(assignments)}', 'success')
+        else:
+            flash('Нет новых заказов или активных водителей для назначения', 'info')
+        return redirect(url_for('dispatch_board'))
+    
+    return render_template('admin/dispatch.html', form=form,
+                         drivers=dispatch.board.drivers(),
+                         unassigned_count=dispatch.unassigned_count())
+
+@app.route('/admin/routes')
+@login_required
+@query_budget(4)
+def route_plan():
+    if current_user.role != 'logist':
+        flash('У вас нет доступа к планированию маршрутов', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    runs, ungeocoded = routing.plan_routes()
+    return render_template('admin/routes.html', runs=runs, ungeocoded=ungeocoded)
+
+@app.route('/admin/events')
+@login_required
+def order_event_stream():
+    """Server-sent events with committed order changes for live admin pages"""
+    if current_user.role != 'logist':
+        abort(403)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    subscription = live_updates.subscribe(request.headers.get('Last-Event-ID'))
+    if subscription is None:
+        return Response(live_updates.busy_stream(), mimetype='text/event-stream', headers=headers)
+    # The stream may stay open for minutes; don't hold a database connection meanwhile
+    db.session.close()
+    return Response(live_updates.stream(subscription), mimetype='text/event-stream', headers=headers)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker process"""
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(instrumentation.render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
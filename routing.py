@@ -0,0 +1,212 @@
+"""Route planning for Astana deliveries.
+
+Confirmed ``astana`` orders are turned into pickup and delivery stops
+(geocoded offline, see geocoding.py) and grouped into one run per driver.
+Orders that already have a driver stay with that driver. Unassigned orders
+are proposed to the active drivers by sweeping around the depot, which keeps
+neighbouring stops in the same run. Each run is ordered with a
+nearest-neighbour tour from the depot, improved by 2-opt over a precomputed
+distance matrix. A pickup always stays ahead of its delivery.
+"""
+import math
+import time
+from collections import defaultdict
+
+from sqlalchemy.orm import load_only
+
+from app import app
+from models import Order
+from geocoding import geocode
+import dispatch
+
+EARTH_RADIUS_KM = 6371.0
+# Straight-line distance understates city driving; this keeps run lengths realistic
+ROAD_FACTOR = 1.3
+
+
+class Stop:
+    def __init__(self, order, kind, address, point):
+        self.order_id = order.id
+        self.tracking_number = order.tracking_number
+        self.kind = kind  # pickup or delivery
+        self.address = address
+        self.point = point
+
+
+class Run:
+    """Ordered stops for one driver"""
+
+    def __init__(self, driver):
+        self.driver = driver  # dispatch.DriverLoad, or None when there is no active driver
+        self.proposed = set()  # ids of unassigned orders suggested for this driver
+        self.orders = []
+        self.stops = []
+        self.distance_km = 0.0
+
+
+def haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def distance_matrix(points):
+    """Symmetric matrix of estimated road distances in km"""
+    size = len(points)
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1, size):
+            matrix[i][j] = matrix[j][i] = haversine_km(points[i], points[j]) * ROAD_FACTOR
+    return matrix
+
+
+def route_length(matrix, route):
+    return sum(matrix[a][b] for a, b in zip(route, route[1:]))
+
+
+def nearest_neighbour(matrix, predecessors):
+    """Open tour from node 0 (the depot) visiting every node.
+
+    ``predecessors`` maps a node to the node that must be visited before it.
+    """
+    route = [0]
+    remaining = set(range(1, len(matrix)))
+    while remaining:
+        last = matrix[route[-1]]
+        candidates = [node for node in remaining if predecessors.get(node) not in remaining]
+        node = min(candidates, key=last.__getitem__)
+        route.append(node)
+        remaining.discard(node)
+    return route
+
+
+def two_opt(matrix, route, predecessors, max_passes=50):
+    """Improve an open tour by reversing segments while that makes it shorter"""
+    route = list(route)
+    size = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, size - 1):
+            a, b = route[i - 1], route[i]
+            for j in range(i + 1, size):
+                c = route[j]
+                e = route[j + 1] if j + 1 < size else None
+                delta = matrix[a][c] - matrix[a][b]
+                if e is not None:
+                    delta += matrix[b][e] - matrix[c][e]
+                if delta >= -1e-9:
+                    continue
+                # Reversing puts a delivery ahead of its pickup if both are in the segment
+                segment = route[i:j + 1]
+                members = set(segment)
+                if any(predecessors.get(node) in members for node in segment):
+                    continue
+                route[i:j + 1] = reversed(segment)
+                a, b = route[i - 1], route[i]
+                improved = True
+        if not improved:
+            break
+    return route
+
+
+def order_run(run, depot):
+    """Sequence a run's stops and compute its length"""
+    points = [depot] + [stop.point for stop in run.stops]
+    matrix = distance_matrix(points)
+    predecessors = {}
+    pickup_node = {}
+    for node, stop in enumerate(run.stops, start=1):
+        if stop.kind == 'pickup':
+            pickup_node[stop.order_id] = node
+    for node, stop in enumerate(run.stops, start=1):
+        if stop.kind == 'delivery' and stop.order_id in pickup_node:
+            predecessors[node] = pickup_node[stop.order_id]
+
+    route = two_opt(matrix, nearest_neighbour(matrix, predecessors), predecessors,
+                    max_passes=app.config['ROUTE_2OPT_MAX_PASSES'])
+    run.stops = [run.stops[node - 1] for node in route[1:]]
+    run.distance_km = route_length(matrix, route)
+
+
+def _bearing(depot, point):
+    return math.atan2(point[0] - depot[0], point[1] - depot[1])
+
+
+def plan_routes():
+    """Group confirmed Astana orders into ordered per-driver runs.
+
+    Returns (runs, ungeocoded orders).
+    """
+    depot = (app.config['DEPOT_LAT'], app.config['DEPOT_LON'])
+    orders = Order.query.options(load_only(
+        Order.id, Order.tracking_number, Order.customer_name, Order.driver_id,
+        Order.pickup_address, Order.delivery_address, Order.created_at
+    )).filter(Order.shipping_type == 'astana', Order.status == 'confirmed').order_by(Order.created_at).all()
+
+    located = []
+    ungeocoded = []
+    for order in orders:
+        pickup, delivery = geocode(order.pickup_address), geocode(order.delivery_address)
+        if pickup is None or delivery is None:
+            ungeocoded.append(order)
+        else:
+            located.append((order, pickup, delivery))
+
+    drivers = {driver.id: driver for driver in dispatch.board.drivers()}
+    runs = {}
+    unassigned = []
+    for order, pickup, delivery in located:
+        if order.driver_id is None:
+            unassigned.append((order, pickup, delivery))
+            continue
+        run = runs.get(order.driver_id)
+        if run is None:
+            run = runs[order.driver_id] = Run(drivers.get(order.driver_id))
+        run.orders.append((order, pickup, delivery))
+
+    if unassigned and drivers:
+        # Sweep around the depot and hand out contiguous slices, fewer to busier drivers
+        unassigned.sort(key=lambda item: _bearing(depot, item[2]))
+        loads = defaultdict(int, {driver_id: len(run.orders) for driver_id, run in runs.items()})
+        total = sum(loads[driver_id] for driver_id in drivers) + len(unassigned)
+        target = math.ceil(total / len(drivers))
+        queue = list(unassigned)
+        for driver in sorted(drivers.values(), key=lambda d: (loads[d.id], d.name)):
+            take = max(0, target - loads[driver.id])
+            if not take or not queue:
+                continue
+            run = runs.get(driver.id)
+            if run is None:
+                run = runs[driver.id] = Run(driver)
+            run.proposed.update(order.id for order, _, _ in queue[:take])
+            run.orders.extend(queue[:take])
+            queue = queue[take:]
+        unassigned = queue
+    if unassigned:
+        runs[None] = Run(None)
+        runs[None].orders.extend(unassigned)
+
+    for run in runs.values():
+        for order, pickup, delivery in run.orders:
+            run.stops.append(Stop(order, 'pickup', order.pickup_address, pickup))
+            run.stops.append(Stop(order, 'delivery', order.delivery_address, delivery))
+        run.orders = [order for order, _, _ in run.orders]
+        order_run(run, depot)
+
+    ordered = sorted(runs.values(), key=lambda run: (run.driver is None, run.driver.name if run.driver else ''))
+    return ordered, ungeocoded
+
+
+@app.cli.command('plan-routes')
+def plan_routes_command():
+    """Print the planned runs for confirmed Astana orders."""
+    started = time.monotonic()
+    runs, ungeocoded = plan_routes()
+    for run in runs:
+        name = run.driver.name if run.driver else 'Без водителя'
+        print(f"{name}: {len(run.orders)} orders, {len(run.stops)} stops, {run.distance_km:.1f} km")
+        for number, stop in enumerate(run.stops, start=1):
+            print(f"  {number:3}. {stop.kind:8} {stop.tracking_number} {stop.address}")
+    if ungeocoded:
+        print(f"Not in the gazetteer: {', '.join(order.tracking_number for order in ungeocoded)}")
+    print(f"Planned in {time.monotonic() - started:.2f}s")
@@ -0,0 +1,57 @@
+"""Ranked full-text search over orders.
+
+PostgreSQL matches against the trigger-maintained ``search_vector`` column
+(GIN index) and phone fragments against ``customer_phone_digits`` (trigram
+index). SQLite uses the ``order_search`` FTS5 table. Both are created by
+migration 6 in migrations.py. Phones are indexed as the digits of
+``customer_phone_e164`` (migration 11), so 8 701..., 7 701... and +7 701...
+all find the same order.
+"""
+import re
+from sqlalchemy import func, literal_column, or_, table, column, desc
+
+from models import Order
+from utils import normalize_phone
+
+PHONE_QUERY_RE = re.compile(r'^[\d\s()+\-.]+$')
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+order_search = table('order_search', column('rowid'), column('rank'))
+
+
+def search_terms(text):
+    """Split a search box value into terms; a phone-like value becomes one digit string"""
+    text = (text or '').strip()
+    if PHONE_QUERY_RE.match(text):
+        # Whole numbers are folded to E.164 like the indexed phones, fragments are matched as typed
+        e164 = normalize_phone(text)
+        digits = e164[1:] if e164 else ''.join(filter(str.isdigit, text))
+        return [digits] if digits else []
+    return TERM_RE.findall(text.lower())
+
+
+def search_orders(query, text, dialect_name):
+    """Restrict an Order query to matches for ``text``, best matches first"""
+    terms = search_terms(text)
+    if not terms:
+        return query.filter(False)
+
+    if dialect_name == 'postgresql':
+        search_vector = literal_column('"order".search_vector')
+        tsquery = func.to_tsquery('simple', ' & '.join(f"{term}:*" for term in terms))
+        condition = search_vector.op('@@')(tsquery)
+        if len(terms) == 1 and terms[0].isdigit() and len(terms[0]) >= 3:
+            phone_digits = literal_column('"order".customer_phone_digits')
+            condition = or_(condition, phone_digits.contains(terms[0]))
+        return query.filter(condition).order_by(
+            desc(func.ts_rank(search_vector, tsquery)), desc(Order.created_at), desc(Order.id)
+        )
+
+    # SQLite FTS5 trigram: every term is a substring match, all terms required
+    terms = [term for term in terms if len(term) >= 3]
+    if not terms:
+        return query.filter(False)
+    match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+    return query.join(order_search, order_search.c.rowid == Order.id).filter(
+        literal_column('order_search').op('MATCH')(match)
+    ).order_by(order_search.c.rank, desc(Order.created_at))
@@ -0,0 +1,158 @@
+"""Outbound notification senders.
+
+Every channel (Telegram, SMS providers) is a NotificationSender registered in
+SENDERS. Senders share one pooled HTTP session, enforce a minimum interval per
+recipient and can coalesce several queued messages into a single digest, so
+notification_worker.py drives every channel through the same pipeline.
+"""
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# One keep-alive connection pool for all outbound provider calls
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+http_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class DeliveryError(Exception):
+    """A message could not be delivered; permanent errors are not retried"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class RateLimited(DeliveryError):
+    """The provider asked us to slow down for ``retry_after`` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RecipientLimiter:
+    """Tracks the earliest time each recipient may receive the next message"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+
+    def wait_time(self, recipient):
+        with self._lock:
+            return max(0.0, self._next_allowed.get(recipient, 0) - time.monotonic())
+
+    def mark_sent(self, recipient):
+        self.block(recipient, self.min_interval)
+
+    def block(self, recipient, seconds):
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._next_allowed[recipient] = max(self._next_allowed.get(recipient, 0), until)
+
+
+class NotificationSender:
+    """Base class for a delivery channel"""
+    channel = None
+    min_interval = 0
+    max_message_length = None  # None disables digests for the channel
+
+    def __init__(self):
+        self.limiter = RecipientLimiter(self.min_interval)
+
+    def resolve_recipient(self, recipient):
+        return recipient
+
+    def send(self, recipient, message):
+        """Deliver one message or raise DeliveryError"""
+        raise NotImplementedError
+
+    def format_digest(self, messages):
+        return messages[0]
+
+    def coalesce(self, messages):
+        """How many of the queued messages fit into the next outgoing message"""
+        if self.max_message_length is None:
+            return 1
+        count, length = 0, 0
+        for message in messages:
+            length += len(message) + 16
+            if count and length > self.max_message_length - 64:
+                break
+            count += 1
+        return count
+
+
+class TelegramSender(NotificationSender):
+    channel = 'telegram'
+    # Telegram allows about 20 messages per minute into one group chat
+    min_interval = float(os.environ.get('TELEGRAM_CHAT_INTERVAL', 3))
+    max_message_length = 4096
+
+    def resolve_recipient(self, recipient):
+        return recipient or os.environ.get('TELEGRAM_CHAT_ID')
+
+    def send(self, recipient, message):
+        bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
+        if not bot_token or not recipient:
+            print(f"Telegram notification: {message}")
+            return
+
+        api_url = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+        try:
+            response = http_session.post(
+                f"{api_url}/bot{bot_token}/sendMessage",
+                data={'chat_id': recipient, 'text': message, 'parse_mode': 'HTML'},
+                timeout=10
+            )
+        except requests.RequestException as e:
+            raise DeliveryError(str(e))
+
+        if response.status_code == 200:
+            return
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after', 30)
+            except ValueError:
+                retry_after = 30
+            raise RateLimited(retry_after)
+        # Other 4xx answers (bad chat id, malformed HTML) will not succeed on retry
+        raise DeliveryError(f"Telegram API returned {response.status_code}: {response.text[:200]}",
+                            permanent=400 <= response.status_code < 500)
+
+    def format_digest(self, messages):
+        if len(messages) == 1:
+            return messages[0]
+        header = f"📬 <b>Сводка: {len(messages)} уведомлений</b>"
+        return header + "\n\n" + "\n\n— — —\n\n".join(messages)
+
+
+class SmsSender(NotificationSender):
+    """SMS placeholder; provider integrations (SMS.ru, SMSC.ru) subclass this"""
+    channel = 'sms'
+    min_interval = 1
+
+    def send(self, recipient, message):
+        print(f"SMS to {recipient}: {message}")
+
+
+SENDERS = {}
+
+
+def register_sender(sender):
+    SENDERS[sender.channel] = sender
+    return sender
+
+
+def get_sender(channel):
+    try:
+        return SENDERS[channel]
+    except KeyError:
+        raise DeliveryError(f"Unknown notification channel: {channel}", permanent=True)
+
+
+register_sender(TelegramSender())
+register_sender(SmsSender())
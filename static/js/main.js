@@ -5,7 +5,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeTooltips();
     initializePopovers();
     initializeFormValidation();
-    initializeAutoRefresh();
+    initializeLiveUpdates();
     initializePhoneFormatting();
     initializeTableSorting();
     initializeNotifications();
@@ -283,27 +283,101 @@ function validateEmail(field) {
     return isValid;
 }
 
-// Auto-refresh functionality for dashboards
-function initializeAutoRefresh() {
-    const refreshInterval = 300000; // 5 minutes
-    const currentPath = window.location.pathname;
-    
-    // Only auto-refresh dashboard and analytics pages
-    if (currentPath.includes('/admin') || currentPath.includes('/analytics')) {
-        setInterval(function() {
-            // Check if user is still active (no typing in forms)
-            const activeElement = document.activeElement;
-            const isTyping = activeElement && (
-                activeElement.tagName === 'INPUT' || 
-                activeElement.tagName === 'TEXTAREA' || 
-                activeElement.tagName === 'SELECT'
-            );
-            
-            if (!isTyping) {
-                location.reload();
-            }
-        }, refreshInterval);
+// Live updates for admin pages: committed order changes arrive over
+// server-sent events and are applied in place instead of reloading the page
+const ORDER_STATUS_BADGES = {
+    'new': ['warning', 'Новая заявка'],
+    'confirmed': ['info', 'Подтверждена'],
+    'in_progress': ['primary', 'В пути'],
+    'delivered': ['success', 'Доставлена'],
+    'cancelled': ['secondary', 'Отменена']
+};
+
+function initializeLiveUpdates() {
+    const root = document.querySelector('[data-live-updates]');
+    if (!root || !window.EventSource) {
+        return;
+    }
+    
+    const source = new EventSource(root.dataset.liveUpdates);
+    
+    source.addEventListener('orders', function(e) {
+        const changes = JSON.parse(e.data);
+        if (changes.some(change => change.resync)) {
+            showLiveNotice('Данные на странице обновились.');
+            return;
+        }
+        changes.forEach(applyOrderChange);
+        document.dispatchEvent(new CustomEvent('orders:changed', { detail: changes }));
+    });
+    
+    source.addEventListener('resync', function() {
+        showLiveNotice('Часть изменений могла быть пропущена.');
+    });
+}
+
+function applyOrderChange(change) {
+    const oldStatus = change.created ? null : change.old_status;
+    
+    if (change.created) {
+        adjustStat('total_orders', 1);
+        showLiveNotice('Появились новые заказы.');
+    }
+    if (change.created || oldStatus !== undefined) {
+        adjustStat(oldStatus + '_orders', -1);
+        adjustStat(change.status + '_orders', 1);
+    }
+    if (change.price) {
+        adjustStat('total_revenue', (change.price[1] || 0) - (change.price[0] || 0));
+    }
+    
+    const badge = ORDER_STATUS_BADGES[change.status];
+    document.querySelectorAll('[data-order-status="' + change.id + '"]').forEach(function(element) {
+        if (badge) {
+            element.className = 'badge bg-' + badge[0];
+            element.textContent = badge[1];
+        }
+        const row = element.closest('tr');
+        if (row) {
+            row.classList.add('table-warning');
+            setTimeout(() => row.classList.remove('table-warning'), 3000);
+        }
+    });
+}
+
+function adjustStat(name, delta) {
+    const element = document.querySelector('[data-stat="' + name + '"]');
+    if (!element) {
+        return;
+    }
+    if (element.dataset.value !== undefined) {
+        // Money: keep the exact value, show it rounded like the server does
+        const value = parseFloat(element.dataset.value) + delta;
+        element.dataset.value = value;
+        element.textContent = Math.round(value).toLocaleString('en-US') + ' ₸';
+    } else {
+        element.textContent = parseInt(element.textContent, 10) + delta;
+    }
+}
+
+function showLiveNotice(message) {
+    let notice = document.getElementById('live-updates-notice');
+    if (!notice) {
+        notice = document.createElement('div');
+        notice.id = 'live-updates-notice';
+        notice.className = 'alert alert-info d-flex justify-content-between align-items-center';
+        const container = document.querySelector('.admin-main-content') || document.querySelector('[data-live-updates]');
+        container.prepend(notice);
     }
+    notice.innerHTML = '';
+    const text = document.createElement('span');
+    text.textContent = message;
+    const button = document.createElement('button');
+    button.type = 'button';
+    button.className = 'btn btn-sm btn-primary';
+    button.textContent = 'Обновить';
+    button.addEventListener('click', () => location.reload());
+    notice.append(text, button);
 }
 
 // Phone number formatting for Kazakhstan numbers
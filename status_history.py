@@ -0,0 +1,145 @@
+"""Order status history and time-in-status statistics.
+
+Every status change is appended to ``order_status_transition`` in the commit
+that makes it (see order_events.py), together with the time the order spent
+in its previous status. That time comes from Order.status_changed_at, which
+is stamped in the same UPDATE as the status, so recording a transition reads
+nothing from the database. refresh_lead_time_stats() condenses the transitions
+of the last LEAD_TIME_WINDOW_DAYS into percentiles per status, shipping type
+and driver, kept in ``order_lead_time_stat`` for the analytics page to read
+with a single query. The notifications worker recomputes it once the stored
+figures are older than LEAD_TIME_REFRESH_INTERVAL; ``flask refresh-lead-times``
+does it on demand.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, inspect, select, delete, insert
+from sqlalchemy.orm import Session
+
+from app import app, db
+from models import Order, OrderStatusTransition, OrderLeadTimeStat
+from order_events import on_order_change
+
+LEAD_TIME = 'lead_time'
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+@event.listens_for(Session, 'before_flush')
+def stamp_status_changes(session, flush_context, instances):
+    """Move status_changed_at along with the status, in the same UPDATE.
+
+    The stamp it replaces is when the order entered its previous status;
+    record_status_transitions takes it from session.info at commit.
+    """
+    now = datetime.utcnow()
+    for obj in session.dirty:
+        if isinstance(obj, Order) and inspect(obj).attrs.status.history.has_changes():
+            previous = session.info.setdefault('status_changed_since', {})
+            previous.setdefault(obj.id, obj.status_changed_at)
+            obj.status_changed_at = now
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_status_stamps(session):
+    session.info.pop('status_changed_since', None)
+
+
+@on_order_change()
+def record_status_transitions(session, changes):
+    now = datetime.utcnow()
+    status_changed_since = session.info.pop('status_changed_since', {})
+
+    for change in changes:
+        order = change.order
+        if change.created:
+            session.add(OrderStatusTransition(
+                order_id=change.order_id, from_status=None, to_status=change.status or 'new',
+                shipping_type=order.shipping_type, driver_id=change.driver_id,
+                transitioned_at=order.created_at or now
+            ))
+        elif 'status' in change.changes:
+            old_status = change.changes['status'][0]
+            transitioned_at = order.status_changed_at or now
+            since = status_changed_since.get(change.order_id)
+            if since is None and old_status == 'new':
+                # Orders created before history was kept start out as new
+                since = order.created_at
+            session.add(OrderStatusTransition(
+                order_id=change.order_id, from_status=old_status, to_status=change.status,
+                shipping_type=order.shipping_type, driver_id=change.driver_id, transitioned_at=transitioned_at,
+                seconds_in_previous=(transitioned_at - since).total_seconds() if since else None
+            ))
+
+
+def refresh_lead_time_stats(window_days=None):
+    """Recompute the percentile table from the transitions in the window"""
+    window_days = window_days or app.config['LEAD_TIME_WINDOW_DAYS']
+    now = datetime.utcnow()
+    since = now - timedelta(days=window_days)
+    samples = defaultdict(list)
+
+    def add_sample(metric, shipping_type, driver_id, seconds):
+        samples[(metric, shipping_type, 0)].append(seconds)
+        if driver_id:
+            samples[(metric, shipping_type, driver_id)].append(seconds)
+
+    transition = OrderStatusTransition
+    in_status = db.session.execute(
+        select(transition.from_status, transition.shipping_type, transition.driver_id, transition.seconds_in_previous)
+        .where(transition.transitioned_at >= since, transition.seconds_in_previous.isnot(None))
+        .execution_options(yield_per=10000)
+    )
+    for from_status, shipping_type, driver_id, seconds in in_status:
+        add_sample(from_status, shipping_type, driver_id, seconds)
+
+    # Full lead time: creation to delivery, for orders delivered in the window
+    delivered = db.session.execute(
+        select(transition.shipping_type, transition.driver_id, transition.transitioned_at, Order.created_at)
+        .join(Order, Order.id == transition.order_id)
+        .where(transition.to_status == 'delivered', transition.transitioned_at >= since)
+        .execution_options(yield_per=10000)
+    )
+    for shipping_type, driver_id, delivered_at, created_at in delivered:
+        if created_at:
+            add_sample(LEAD_TIME, shipping_type, driver_id, (delivered_at - created_at).total_seconds())
+
+    rows = []
+    for (metric, shipping_type, driver_id), values in samples.items():
+        values.sort()
+        rows.append({
+            'metric': metric, 'shipping_type': shipping_type, 'driver_id': driver_id,
+            'sample_count': len(values),
+            'p50_seconds': percentile(values, 0.50),
+            'p90_seconds': percentile(values, 0.90),
+            'p95_seconds': percentile(values, 0.95),
+            'computed_at': now,
+        })
+
+    db.session.execute(delete(OrderLeadTimeStat))
+    if rows:
+        db.session.execute(insert(OrderLeadTimeStat), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def refresh_lead_time_stats_if_stale(max_age=None):
+    """Recompute unless another process did within max_age seconds; returns whether it ran"""
+    max_age = max_age or app.config['LEAD_TIME_REFRESH_INTERVAL']
+    computed_at = db.session.execute(select(func.max(OrderLeadTimeStat.computed_at))).scalar()
+    if computed_at is not None and datetime.utcnow() - computed_at < timedelta(seconds=max_age):
+        return False
+    refresh_lead_time_stats()
+    return True
+
+
+@app.cli.command('refresh-lead-times')
+def refresh_lead_times_command():
+    """Recompute time-in-status percentiles for the analytics page."""
+    count = refresh_lead_time_stats()
+    print(f"Stored {count} time-in-status percentile rows")
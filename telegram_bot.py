@@ -1,33 +1,62 @@
-import os
+from html import escape
+
+from app import db
+import dispatch
+from models import NotificationOutbox, Driver
+from order_events import on_order_change
 from utils import send_telegram_notification
 
-def send_order_notification(order):
-    """Send new order notification to Telegram"""
+# More new orders than this in one commit (a bulk import) get one summary message
+NEW_ORDERS_SUMMARY_THRESHOLD = 10
+
+def queue_notification(message, channel='telegram', recipient=None):
+    """Add a notification to the outbox in the current transaction.
+
+    It is delivered by notification_worker.py after the surrounding commit,
+    so the request never waits on the messaging provider.
+    """
+    notification = NotificationOutbox(channel=channel, recipient=recipient, message=message)
+    db.session.add(notification)
+    return notification
+
+def format_order_message(order):
+    """Build the new order notification text; user-entered values are escaped for parse_mode=HTML"""
     message = f"""
 🚚 <b>Новая заявка #{order.tracking_number}</b>
 
-👤 <b>Клиент:</b> {order.customer_name}
-📱 <b>Телефон:</b> {order.customer_phone}
-📧 <b>Email:</b> {order.customer_email or 'Не указан'}
+👤 <b>Клиент:</b> {escape(order.customer_name)}
+📱 <b>Телефон:</b> {escape(order.customer_phone)}
+📧 <b>Email:</b> {escape(order.customer_email or 'Не указан')}
 
 📍 <b>Тип доставки:</b> {order.get_shipping_type_display()}
 
-📦 <b>Описание груза:</b> {order.cargo_description}
+📦 <b>Описание груза:</b> {escape(order.cargo_description)}
 ⚖️ <b>Вес:</b> {order.cargo_weight or 'Не указан'} кг
-📏 <b>Габариты:</b> {order.cargo_dimensions or 'Не указаны'}
+📏 <b>Габариты:</b> {escape(order.cargo_dimensions or 'Не указаны')}
 
-🏠 <b>Адрес погрузки:</b> {order.pickup_address}
-🏢 <b>Адрес выгрузки:</b> {order.delivery_address}
+🏠 <b>Адрес погрузки:</b> {escape(order.pickup_address)}
+🏢 <b>Адрес выгрузки:</b> {escape(order.delivery_address)}
 
-📝 <b>Комментарии:</b> {order.customer_notes or 'Нет'}
+📝 <b>Комментарии:</b> {escape(order.customer_notes or 'Нет')}
 
 ⏰ <b>Время создания:</b> {order.created_at.strftime('%d.%m.%Y %H:%M')}
     """
     
-    return send_telegram_notification(message.strip())
+    return message.strip()
 
-def send_status_update(order, old_status, new_status):
-    """Send order status update notification"""
+def format_new_orders_summary(orders, listed=20):
+    """One message for a batch of new orders (bulk import)"""
+    numbers = ', '.join(order.tracking_number for order in orders[:listed])
+    if len(orders) > listed:
+        numbers += f' и ещё {len(orders) - listed}'
+    return f"📥 <b>Новые заявки: {len(orders)}</b>\n\n{numbers}"
+
+def send_order_notification(order):
+    """Send new order notification to Telegram immediately"""
+    return send_telegram_notification(format_order_message(order))
+
+def format_status_message(order, old_status, new_status, driver=None):
+    """Build the status change notification text"""
     status_map = {
         'new': 'Новая заявка',
         'confirmed': 'Подтверждена',
@@ -39,13 +68,37 @@ def send_status_update(order, old_status, new_status):
     message = f"""
 📊 <b>Изменение статуса заказа #{order.tracking_number}</b>
 
-👤 <b>Клиент:</b> {order.customer_name}
-📱 <b>Телефон:</b> {order.customer_phone}
+👤 <b>Клиент:</b> {escape(order.customer_name)}
+📱 <b>Телефон:</b> {escape(order.customer_phone)}
 
 📈 <b>Статус изменен:</b> {status_map.get(old_status, old_status)} → {status_map.get(new_status, new_status)}
 
 💰 <b>Цена:</b> {f'{order.price} ₸' if order.price else 'Не назначена'}
-🚛 <b>Водитель:</b> {order.assigned_driver.name if order.assigned_driver else 'Не назначен'}
+🚛 <b>Водитель:</b> {escape(driver.name) if driver else 'Не назначен'}
     """
     
-    return send_telegram_notification(message.strip())
+    return message.strip()
+
+def send_status_update(order, old_status, new_status):
+    """Send order status update notification"""
+    return send_telegram_notification(format_status_message(order, old_status, new_status, order.assigned_driver))
+
+@on_order_change()
+def queue_order_change_notifications(session, changes):
+    """Queue Telegram messages for new orders and status changes in the committing transaction"""
+    created = [change.order for change in changes if change.created]
+    if len(created) > NEW_ORDERS_SUMMARY_THRESHOLD:
+        queue_notification(format_new_orders_summary(created))
+    else:
+        for order in created:
+            queue_notification(format_order_message(order))
+
+    for change in changes:
+        if not change.created and 'status' in change.changes:
+            order = change.order
+            old_status, new_status = change.changes['status']
+            driver = None
+            if order.driver_id:
+                # Inactive drivers aren't on the board
+                driver = dispatch.board.driver(order.driver_id) or session.get(Driver, order.driver_id)
+            queue_notification(format_status_message(order, old_status, new_status, driver))
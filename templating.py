@@ -0,0 +1,151 @@
+"""Template rendering: bytecode cache, fragment cache and streamed pages.
+
+Compiled templates are kept in TEMPLATE_BYTECODE_CACHE_DIR, so new workers
+load them instead of compiling every template again.
+
+Expensive blocks are cached as rendered HTML with the ``cache`` tag:
+
+    {% cache 'dashboard', current_user.id, data_version() %} ... {% endcache %}
+
+The key is the fragment name and the values that follow. data_version()
+changes whenever orders, drivers or lead-time statistics change, so the key
+carries its own invalidation and every worker agrees on it. Views pass the
+data of a cached block as Deferred, so on a hit its queries never run.
+
+stream_page() sends long listings as they render instead of building the
+whole page in memory first.
+"""
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app, g, get_flashed_messages, Response, stream_template
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+
+class FragmentCache:
+    """Thread-safe in-process LRU of rendered fragments; keys are versioned, so entries never expire"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._data.get(key)
+            if html is not None:
+                self._data.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        with self._lock:
+            self._data[key] = html
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class FragmentCacheExtension(Extension):
+    """The ``{% cache name, key... %}...{% endcache %}`` tag"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_cached', [nodes.Tuple(key, 'load')]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or self.environment.auto_reload:
+            # Edited templates must show up immediately while developing
+            return caller()
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, html)
+        return html
+
+
+class Deferred:
+    """The dict returned by fn(*args), computed on first attribute access"""
+
+    def __init__(self, fn, *args):
+        self._fn = fn
+        self._args = args
+        self._values = None
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._values is None:
+            self._values = self._fn(*self._args)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def data_version():
+    """Version of the data admin fragments are built from, queried once per request"""
+    if 'data_version' not in g:
+        from sqlalchemy import func, select
+        from app import db
+        from models import Order, Driver, OrderLeadTimeStat
+        g.data_version = tuple(db.session.execute(select(
+            select(func.max(Order.updated_at)).scalar_subquery(),
+            select(func.max(Driver.id)).scalar_subquery(),
+            select(func.max(OrderLeadTimeStat.computed_at)).scalar_subquery(),
+        )).one())
+    return g.data_version
+
+
+def _buffered(chunks, size):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    """Stream a rendered page in chunks of TEMPLATE_STREAM_CHUNK characters.
+
+    Jinja yields every text node and expression separately; joining them keeps
+    the number of socket writes low while the top of the page still goes out
+    before the rest has rendered.
+
+    The session cookie is sent with the first chunk, so flashed messages are
+    taken out of the session here; the template gets the same messages from
+    get_flashed_messages() and they are not shown again on the next page.
+    """
+    get_flashed_messages()
+    return Response(_buffered(stream_template(template_name, **context),
+                              current_app.config['TEMPLATE_STREAM_CHUNK']))
+
+
+def init_templating(app):
+    """Install the bytecode cache, the cache tag and data_version()"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['data_version'] = data_version
+
+    cache_dir = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if app.config['TEMPLATE_FRAGMENT_CACHE_SIZE']:
+        app.jinja_env.fragment_cache = FragmentCache(app.config['TEMPLATE_FRAGMENT_CACHE_SIZE'])
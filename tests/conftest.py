@@ -0,0 +1,84 @@
+"""The app is configured at import, so the test database is chosen before main is imported."""
+import os
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix='logistics-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_workdir, 'logistics.db')
+os.environ['TEMPLATE_BYTECODE_CACHE_DIR'] = ''
+os.environ['METRICS_ENABLED'] = '1'
+os.environ.pop('REPLICA_DATABASE_URL', None)
+
+from main import app as flask_app  # noqa: E402
+from app import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def logist_client(client):
+    """Client logged in as the default admin (role logist)"""
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        session.pop('_flashes', None)
+    return client
+
+
+@pytest.fixture(scope='session')
+def dataset():
+    """A few hundred orders across statuses, shipping types, customers and drivers.
+
+    Created once through the ORM, so order events, the rollup and status
+    history see them the way they see orders created from the site.
+    """
+    from werkzeug.security import generate_password_hash
+    from models import Driver, Order, User
+    from tracking_numbers import generate_tracking_number
+
+    statuses = ['new', 'confirmed', 'in_progress', 'delivered', 'cancelled']
+    with flask_app.app_context():
+        # Numbers are reserved on a connection of their own, before the session holds a write lock
+        tracking_numbers = [generate_tracking_number() for _ in range(300)]
+        employee = User(username='employee', email='employee@hrom-kz.com', full_name='Сотрудник',
+                        phone='+77017654321', password_hash=generate_password_hash('employee123'),
+                        role='employee')
+        drivers = [Driver(name=f'Водитель {index}', phone=f'+7701000000{index}',
+                          vehicle_info='Газель', is_active=True) for index in range(5)]
+        db.session.add_all([employee, *drivers])
+        db.session.flush()
+
+        orders = []
+        for index in range(300):
+            status = statuses[index % len(statuses)]
+            orders.append(Order(
+                tracking_number=tracking_numbers[index],
+                customer_name=f'Клиент {index}',
+                customer_phone=f'8 701 {index:03d} 45 67',
+                customer_email=f'client{index}@example.kz',
+                customer_id=employee.id if index % 3 == 0 else None,
+                shipping_type='astana' if index % 2 else 'kazakhstan',
+                pickup_address=f'Астана, ул. Кенесары {index}',
+                delivery_address=f'Караганда, пр. Бухар-Жырау {index}',
+                cargo_description='Металлопрокат ' * 20,
+                cargo_weight=100 + index,
+                status=status,
+                price=10000 + index * 10 if status != 'new' else None,
+                driver_id=drivers[index % len(drivers)].id if status != 'new' else None,
+            ))
+        db.session.add_all(orders)
+        db.session.commit()
+        return {'employee_id': employee.id, 'driver_ids': [driver.id for driver in drivers],
+                'order_ids': [order.id for order in orders]}
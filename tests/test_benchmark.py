@@ -0,0 +1,16 @@
+import pytest
+
+import benchmark
+
+
+def test_peak_rss_is_measured_per_scenario():
+    if not benchmark.reset_peak_rss():
+        pytest.skip('peak RSS can only be reset on Linux')
+
+    ballast = bytearray(64 * 1024 * 1024)
+    ballast[::4096] = b'x' * len(ballast[::4096])
+    assert benchmark.peak_rss_mb() >= benchmark.rss_mb() >= 64
+    del ballast
+
+    benchmark.reset_peak_rss()
+    assert benchmark.peak_rss_mb() < benchmark.rss_mb() + 32
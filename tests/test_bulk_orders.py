@@ -0,0 +1,59 @@
+import csv
+import io
+
+from app import db
+from bulk_orders import export_orders_csv, import_orders, iter_csv_rows
+from models import NotificationOutbox, Order, OrderStatusTransition
+
+HEADER = 'customer_name;customer_phone;shipping_type;pickup_address;delivery_address;cargo_description\n'
+
+
+def csv_rows(count, name):
+    lines = [f'{name} {index};8 702 {index:03d} 11 22;astana;ул. Кенесары, 1;пр. Республики, 2;Коробки с посудой\n'
+             for index in range(count)]
+    return iter_csv_rows(io.BytesIO((HEADER + ''.join(lines)).encode('utf-8')))
+
+
+def import_and_collect(app, count, name):
+    with app.app_context():
+        last_message = db.session.query(db.func.max(NotificationOutbox.id)).scalar() or 0
+        result = import_orders(csv_rows(count, name), batch_size=100)
+        assert (result.imported, result.failed) == (count, 0)
+
+        orders = Order.query.filter(Order.customer_name.startswith(name)).all()
+        transitions = OrderStatusTransition.query.filter(
+            OrderStatusTransition.order_id.in_([order.id for order in orders])).all()
+        messages = [row.message for row in NotificationOutbox.query.filter(NotificationOutbox.id > last_message)]
+        return orders, transitions, messages
+
+
+def test_bulk_import_records_history_and_one_summary(app, dataset):
+    orders, transitions, messages = import_and_collect(app, 15, 'Импорт')
+
+    assert len(orders) == 15
+    assert sorted((t.order_id, t.from_status, t.to_status) for t in transitions) == \
+        sorted((order.id, None, 'new') for order in orders)
+    assert len(messages) == 1
+    assert 'Новые заявки: 15' in messages[0]
+    assert orders[0].tracking_number in messages[0]
+
+
+def test_small_import_notifies_per_order(app, dataset):
+    orders, transitions, messages = import_and_collect(app, 2, 'Пара')
+
+    assert len(orders) == len(transitions) == len(messages) == 2
+    for order in orders:
+        assert any(order.tracking_number in message for message in messages)
+
+
+def test_export_neutralizes_formulas(app, dataset):
+    with app.app_context():
+        order = db.session.get(Order, dataset['order_ids'][9])
+        order.customer_name = '=HYPERLINK("http://example.com","Открыть")'
+        order.cargo_description = '@SUM(1+1)'
+        db.session.commit()
+        text = ''.join(export_orders_csv(Order.query.filter_by(id=order.id)))
+
+    [_, row] = list(csv.reader(io.StringIO(text.lstrip('﻿'))))
+    assert '\'=HYPERLINK("http://example.com","Открыть")' in row
+    assert "'@SUM(1+1)" in row
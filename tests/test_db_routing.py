@@ -0,0 +1,109 @@
+"""Read-replica routing.
+
+The replica bind is configured when the app is imported, so the end-to-end
+test runs the app in a subprocess against two separate databases. They are
+two SQLite files by default, or two PostgreSQL servers given as
+ROUTING_TEST_PRIMARY_URL and ROUTING_TEST_REPLICA_URL. Nothing replicates
+between them, which makes "the replica lags" the normal state.
+"""
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+from flask import g, session
+
+from app import db
+from db_routing import STICKY_KEY, reads_from_replica
+from models import Order
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIO = textwrap.dedent('''
+    import json
+    from main import app
+    from app import db
+    from models import Order
+    from tracking_numbers import generate_tracking_number
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        tracking_number = generate_tracking_number()
+        order = Order(tracking_number=tracking_number, customer_name='Только на основной',
+                      customer_phone='+77015550000', shipping_type='astana',
+                      pickup_address='Астана, ул. Сарайшык 3', delivery_address='Астана, ул. Бейбитшилик 4',
+                      cargo_description='Документы', status='new')
+        db.session.add(order)
+        db.session.commit()
+        order_id = order.id
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    results = {'before_write': tracking_number in client.get('/admin').get_data(as_text=True)}
+
+    response = client.post(f'/admin/orders/{order_id}/edit', data={
+        'status': 'confirmed', 'driver_id': 0, 'customer_phone': '+77015550000',
+        'pickup_address': 'Астана, ул. Сарайшык 3', 'delivery_address': 'Астана, ул. Бейбитшилик 4',
+    })
+    results['edit_status'] = response.status_code
+    results['after_write'] = tracking_number in client.get('/admin').get_data(as_text=True)
+    other = app.test_client()
+    other.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    results['other_client'] = tracking_number in other.get('/admin').get_data(as_text=True)
+    print(json.dumps(results))
+''')
+
+
+def run_app(code, **env):
+    environment = dict(os.environ, TEMPLATE_BYTECODE_CACHE_DIR='', **env)
+    environment.pop('REPLICA_DATABASE_URL', None)
+    environment.update(env)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=environment,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def database_pairs():
+    primary, replica = os.environ.get('ROUTING_TEST_PRIMARY_URL'), os.environ.get('ROUTING_TEST_REPLICA_URL')
+    pairs = [pytest.param(None, None, id='sqlite')]
+    pairs.append(pytest.param(primary, replica, id='postgresql', marks=pytest.mark.skipif(
+        not (primary and replica), reason='ROUTING_TEST_PRIMARY_URL and ROUTING_TEST_REPLICA_URL not set')))
+    return pairs
+
+
+@pytest.mark.parametrize('primary, replica', database_pairs())
+def test_replica_reads_until_own_write(tmp_path, primary, replica):
+    primary = primary or f"sqlite:///{tmp_path / 'primary.db'}"
+    replica = replica or f"sqlite:///{tmp_path / 'replica.db'}"
+    # Same schema and admin on both, as a replica would have
+    run_app('import main', DATABASE_URL=replica)
+
+    output = run_app(SCENARIO, DATABASE_URL=primary, REPLICA_DATABASE_URL=replica)
+    results = json.loads(output.strip().splitlines()[-1])
+
+    assert results == {
+        'before_write': False,   # dashboard read from the replica, which doesn't have the order
+        'edit_status': 302,      # writes go to the primary
+        'after_write': True,     # the writer is pinned to the primary
+        'other_client': False,   # everyone else keeps reading the replica
+    }
+
+
+def test_request_keeps_reading_primary_after_commit(app, dataset):
+    # No replica is configured in this process; only the routing decision is checked
+    with app.test_request_context('/admin'):
+        order = db.session.get(Order, dataset['order_ids'][20])
+        g.read_replica = True
+        g.replica_sticky_seconds = 10
+        assert reads_from_replica()
+
+        order.internal_comments = 'Проверка маршрутизации'
+        db.session.commit()
+
+        assert not reads_from_replica()
+        assert session[STICKY_KEY] > time.time()
+        db.session.remove()
@@ -0,0 +1,21 @@
+import dispatch
+
+
+def test_drivers_are_snapshots(app, dataset):
+    with app.app_context():
+        driver = dispatch.board.drivers()[0]
+        open_orders = dict(driver.open_orders)
+
+        dispatch.board.apply_change(10 ** 9, 'HK000000TEST00', 'confirmed', driver.id)
+        try:
+            assert driver.open_orders == open_orders
+            assert 10 ** 9 in dispatch.board.driver(driver.id).open_orders
+        finally:
+            dispatch.board.apply_change(10 ** 9, 'HK000000TEST00', 'delivered', driver.id)
+
+
+def test_driver_choices_least_loaded_first(app, dataset):
+    with app.app_context():
+        loads = [driver.load for driver in dispatch.board.drivers()]
+        assert loads == sorted(loads)
+        assert dispatch.driver_choices()[0] == (0, 'Не назначен')
@@ -0,0 +1,32 @@
+import os
+import runpy
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_config(monkeypatch, **env):
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.delenv('WORKER_DB_CONNECTIONS', raising=False)
+    # The hooks' live module globals, not the copy run_path returns
+    return runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))['when_ready'].__globals__
+
+
+def test_master_runs_the_notifications_worker(monkeypatch):
+    config = load_config(monkeypatch)
+    config['when_ready'](None)
+    worker = config['notifications_worker']
+    try:
+        assert worker.args == [sys.executable, '-m', 'flask', '--app', 'main', 'notifications-worker']
+        assert worker.poll() is None
+    finally:
+        config['on_exit'](None)
+    assert worker.poll() is not None
+
+
+def test_separately_deployed_worker_is_not_started_twice(monkeypatch):
+    config = load_config(monkeypatch, NOTIFICATIONS_WORKER='0')
+    config['when_ready'](None)
+    assert config['notifications_worker'] is None
+    config['on_exit'](None)
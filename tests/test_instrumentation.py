@@ -0,0 +1,37 @@
+import instrumentation
+
+
+def requests_served(endpoint):
+    return sum(value for (name, _, _), value in instrumentation.REQUESTS._values.items() if name == endpoint)
+
+
+def test_streamed_response_is_recorded_when_closed(logist_client, dataset):
+    before = requests_served('admin_orders')
+
+    response = logist_client.get('/admin/orders')
+    assert response.is_streamed
+    assert requests_served('admin_orders') == before
+
+    response.get_data()
+    response.close()
+    assert requests_served('admin_orders') == before + 1
+
+
+def test_metrics_token(app, client):
+    app.config['METRICS_TOKEN'] = 'secret'
+    try:
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer secreT'}).status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+        assert 'http_requests_total' in response.get_data(as_text=True)
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+def test_metrics_not_served_when_disabled(app, client):
+    app.config['METRICS_ENABLED'] = False
+    try:
+        assert client.get('/metrics').status_code == 404
+    finally:
+        app.config['METRICS_ENABLED'] = True
@@ -0,0 +1,47 @@
+import pytest
+
+import live_updates
+from live_updates import EventBroker
+
+
+@pytest.fixture
+def employee_client(app, dataset):
+    client = app.test_client()
+    client.post('/login', data={'username': 'employee', 'password': 'employee123'})
+    return client
+
+
+def test_broker_caps_subscribers():
+    broker = EventBroker(max_subscribers=2)
+    first, second = broker.subscribe(), broker.subscribe()
+    assert broker.subscribe() is None
+
+    broker.unsubscribe(first)
+    assert broker.subscribe() is not None
+    assert second is not None
+
+
+def test_event_stream_is_for_logists_only(employee_client, logist_client):
+    assert employee_client.get('/admin/events').status_code == 403
+    assert 'data-live-updates' not in employee_client.get('/admin/orders').get_data(as_text=True)
+    assert 'data-live-updates' in logist_client.get('/admin/orders').get_data(as_text=True)
+
+
+def test_logist_gets_a_stream(logist_client):
+    response = logist_client.get('/admin/events')
+    assert response.mimetype == 'text/event-stream'
+    assert next(iter(response.response)) == b'retry: 3000\n\n'
+    response.close()
+
+
+def test_busy_worker_asks_browsers_to_retry_later(app, logist_client):
+    broker = live_updates.broker
+    held = [broker.subscribe() for _ in range(broker.max_subscribers)]
+    try:
+        response = logist_client.get('/admin/events')
+        retry = app.config['LIVE_STREAM_BUSY_RETRY'] * 1000
+        assert response.get_data(as_text=True) == f'retry: {retry}\n\n'
+    finally:
+        for subscription in held:
+            if subscription is not None:
+                broker.unsubscribe(subscription)
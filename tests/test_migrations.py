@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import migrations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class LockConnection:
+    """Answers pg_try_advisory_lock with False until the holder lets go"""
+
+    def __init__(self, busy_polls):
+        self.busy_polls = busy_polls
+        self.statements = []
+
+    def execute(self, statement, parameters=None):
+        self.statements.append(str(statement))
+        self.busy_polls -= 1
+        return FakeResult(self.busy_polls < 0)
+
+
+def test_migration_lock_is_polled_not_waited_for(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(migrations.time, 'sleep', sleeps.append)
+    connection = LockConnection(busy_polls=3)
+
+    migrations.acquire_migration_lock(connection)
+
+    assert sleeps == [migrations.MIGRATION_LOCK_POLL] * 3
+    assert all('pg_try_advisory_lock' in statement for statement in connection.statements)
+
+
+def test_upgrade_is_idempotent(app):
+    with app.app_context():
+        assert migrations.upgrade() == migrations.MIGRATIONS[-1][0]
+        assert migrations.upgrade() == migrations.MIGRATIONS[-1][0]
+
+
+def test_processes_starting_together_set_up_sqlite_once(tmp_path):
+    database = tmp_path / 'fresh.db'
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', TEMPLATE_BYTECODE_CACHE_DIR='')
+    env.pop('REPLICA_DATABASE_URL', None)
+    processes = [subprocess.Popen([sys.executable, '-c', 'import app'], cwd=ROOT, env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                 for _ in range(4)]
+    outputs = [process.communicate(timeout=120)[0].decode() for process in processes]
+
+    assert [process.returncode for process in processes] == [0] * 4, '\n'.join(outputs)
+    connection = sqlite3.connect(database)
+    try:
+        assert connection.execute("SELECT count(*) FROM user WHERE username = 'admin'").fetchone() == (1,)
+        assert connection.execute("SELECT count(*) FROM tracking_sequence").fetchone() == (1,)
+        assert connection.execute("SELECT max(version) FROM schema_version").fetchone() == \
+            (migrations.MIGRATIONS[-1][0],)
+    finally:
+        connection.close()
@@ -0,0 +1,161 @@
+"""The outbox worker against a local fake of the Telegram Bot API."""
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from app import db
+from models import NotificationOutbox
+from notification_worker import drain_outbox
+from senders import get_sender
+from telegram_bot import queue_notification
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    """Records sendMessage calls and answers with the scripted (status, body) replies, then 200"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeTelegramHandler)
+        self.requests = []
+        self.replies = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        fields = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        self.server.requests.append((self.path, fields))
+        status, reply = self.server.replies.pop(0) if self.server.replies else (200, {'ok': True})
+        payload = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def telegram(app, monkeypatch):
+    server = FakeTelegram()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('TELEGRAM_API_URL', server.url)
+    monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test-token')
+    monkeypatch.setenv('TELEGRAM_CHAT_ID', '-100123')
+    get_sender('telegram').limiter._next_allowed.clear()
+    with app.app_context():
+        # Only the messages a test queues itself
+        NotificationOutbox.query.delete()
+        db.session.commit()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def queue(app, *messages):
+    with app.app_context():
+        for message in messages:
+            queue_notification(message)
+        db.session.commit()
+
+
+def outbox(app):
+    with app.app_context():
+        return NotificationOutbox.query.order_by(NotificationOutbox.id).all()
+
+
+def test_order_creation_is_delivered_by_the_worker(app, client, telegram):
+    response = client.post('/order/astana', data={
+        'customer_name': 'Айгерим', 'customer_phone': '+7 701 555 11 22',
+        'pickup_address': 'Астана, ул. Туран 1', 'delivery_address': 'Астана, ул. Кабанбай 2',
+        'cargo_description': 'Коробки',
+    })
+    assert response.status_code == 302
+    # Nothing was sent from the request itself
+    assert telegram.requests == []
+
+    with app.app_context():
+        assert drain_outbox() == 1
+    [(path, fields)] = telegram.requests
+    assert path == '/bottest-token/sendMessage'
+    assert fields['chat_id'] == '-100123'
+    assert 'Айгерим' in fields['text']
+    assert [row.status for row in outbox(app)] == ['sent']
+
+
+def test_burst_is_sent_as_one_digest(app, telegram):
+    queue(app, 'первое', 'второе', 'третье')
+    with app.app_context():
+        assert drain_outbox() == 3
+    [(_, fields)] = telegram.requests
+    assert 'Сводка: 3 уведомлений' in fields['text']
+    assert all(row.status == 'sent' for row in outbox(app))
+
+
+def test_server_error_is_retried_with_backoff(app, telegram):
+    telegram.replies.append((502, {'ok': False}))
+    queue(app, 'повтор')
+    with app.app_context():
+        drain_outbox()
+    [row] = outbox(app)
+    assert (row.status, row.attempts) == ('pending', 1)
+    delay = (row.next_attempt_at - datetime.utcnow()).total_seconds()
+    assert 0 < delay <= app.config['OUTBOX_BACKOFF_BASE']
+
+    # Due again: delivered on the next pass
+    with app.app_context():
+        db.session.get(NotificationOutbox, row.id).next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        drain_outbox()
+    assert [row.status for row in outbox(app)] == ['sent']
+    assert len(telegram.requests) == 2
+
+
+def test_rate_limit_postpones_without_counting_an_attempt(app, telegram):
+    telegram.replies.append((429, {'ok': False, 'parameters': {'retry_after': 40}}))
+    queue(app, 'лимит')
+    with app.app_context():
+        drain_outbox()
+    [row] = outbox(app)
+    assert (row.status, row.attempts) == ('pending', 0)
+    assert 30 < (row.next_attempt_at - datetime.utcnow()).total_seconds() <= 40
+
+
+def test_client_error_is_not_retried(app, telegram):
+    telegram.replies.append((400, {'ok': False, 'description': 'Bad Request: chat not found'}))
+    queue(app, 'ошибка')
+    with app.app_context():
+        drain_outbox()
+    [row] = outbox(app)
+    assert row.status == 'failed'
+    assert 'chat not found' in row.last_error
+
+
+def test_rejected_digest_is_retried_one_message_at_a_time(app, telegram):
+    telegram.replies += [(400, {'ok': False, 'description': "Bad Request: can't parse entities"}),
+                         (200, {'ok': True}), (400, {'ok': False, 'description': 'Bad Request'}),
+                         (200, {'ok': True})]
+    queue(app, 'первое', 'второе', 'третье')
+
+    for _ in range(4):
+        with app.app_context():
+            for row in NotificationOutbox.query.filter_by(status='pending'):
+                row.next_attempt_at = datetime.utcnow()
+            db.session.commit()
+        get_sender('telegram').limiter._next_allowed.clear()
+        with app.app_context():
+            drain_outbox()
+
+    assert 'Сводка: 3 уведомлений' in telegram.requests[0][1]['text']
+    assert [fields['text'] for _, fields in telegram.requests[1:]] == ['первое', 'второе', 'третье']
+    assert [row.status for row in outbox(app)] == ['sent', 'failed', 'sent']
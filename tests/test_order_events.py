@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from app import db
+from models import NotificationOutbox, Order, OrderAuditLog, OrderStatusTransition
+
+
+def edit_form(order, **fields):
+    data = {
+        'status': order.status, 'price': order.price or '', 'driver_id': order.driver_id or 0,
+        'customer_phone': order.customer_phone, 'customer_email': order.customer_email or '',
+        'pickup_address': order.pickup_address, 'delivery_address': order.delivery_address,
+    }
+    data.update(fields)
+    return data
+
+
+def test_edit_records_audit_and_transition_within_budget(app, logist_client, dataset):
+    driver_id = dataset['driver_ids'][3]
+    with app.app_context():
+        order = db.session.get(Order, dataset['order_ids'][5])  # new, unassigned
+        assert order.status == 'new'
+        order.status_changed_at = datetime.utcnow() - timedelta(hours=2)
+        db.session.commit()
+        data = edit_form(order, status='confirmed', price='25000', driver_id=driver_id)
+
+    # In testing mode a view over its @query_budget raises QueryBudgetExceeded
+    response = logist_client.post(f"/admin/orders/{dataset['order_ids'][5]}/edit", data=data)
+    assert response.status_code == 302
+
+    with app.app_context():
+        order = db.session.get(Order, dataset['order_ids'][5])
+        audit = {row.field: (row.old_value, row.new_value)
+                 for row in OrderAuditLog.query.filter_by(order_id=order.id)}
+        assert audit == {'status': ('new', 'confirmed'), 'price': (None, '25000.0'),
+                         'driver_id': (None, str(driver_id))}
+
+        transition = OrderStatusTransition.query.filter_by(order_id=order.id, from_status='new').one()
+        assert transition.to_status == 'confirmed'
+        assert 2 * 3600 <= transition.seconds_in_previous < 2 * 3600 + 60
+        assert order.status_changed_at == transition.transitioned_at
+
+        # Driver name comes from the dispatch board, not another query
+        message = NotificationOutbox.query.order_by(NotificationOutbox.id.desc()).first().message
+        assert order.tracking_number in message
+        assert 'Водитель 3' in message
+
+
+def test_notification_text_escapes_customer_input(app, dataset):
+    from telegram_bot import format_order_message
+    with app.app_context():
+        order = db.session.get(Order, dataset['order_ids'][7])
+        order.customer_name = 'ТОО <Рога & Копыта>'
+        message = format_order_message(order)
+        db.session.rollback()
+    assert 'ТОО &lt;Рога &amp; Копыта&gt;' in message
+    assert '<b>Клиент:</b>' in message
@@ -0,0 +1,76 @@
+"""Every view with @query_budget, driven against the dataset fixture.
+
+Statements are counted here over the whole response, including the body of
+streamed pages. The after_request check in query_budget.py only sees what ran
+before streaming started.
+"""
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import db
+from models import Order
+
+
+@pytest.fixture
+def employee_client(app, dataset):
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'employee', 'password': 'employee123'})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def tracking_number(app, dataset):
+    with app.app_context():
+        return db.session.get(Order, dataset['order_ids'][7]).tracking_number
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    yield executed
+    event.remove(Engine, 'before_cursor_execute', count)
+
+
+VIEWS = [
+    ('track_order', 'client', '/track/{tracking_number}'),
+    ('api_track_order', 'client', '/api/track/{tracking_number}'),
+    ('profile', 'employee_client', '/profile'),
+    ('admin_dashboard', 'logist_client', '/admin'),
+    ('admin_orders', 'logist_client', '/admin/orders'),
+    ('admin_orders', 'logist_client', '/admin/orders?status=delivered&shipping_type=astana'),
+    ('admin_orders', 'logist_client', '/admin/orders?q=Кенесары'),
+    ('admin_orders', 'employee_client', '/admin/orders'),
+    ('edit_order', 'logist_client', '/admin/orders/{order_id}/edit'),
+    ('analytics', 'logist_client', '/admin/analytics?days=365'),
+    ('analytics_data', 'logist_client', '/admin/analytics/data?days=365'),
+    ('route_plan', 'logist_client', '/admin/routes'),
+]
+
+
+def test_every_budgeted_view_is_covered(app):
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert budgeted == {endpoint for endpoint, _, _ in VIEWS}
+
+
+@pytest.mark.parametrize('endpoint, client_name, url', VIEWS)
+def test_view_stays_within_query_budget(request, app, dataset, tracking_number, statements,
+                                        endpoint, client_name, url):
+    client = request.getfixturevalue(client_name)
+    url = url.format(tracking_number=tracking_number, order_id=dataset['order_ids'][11])
+    budget = app.view_functions[endpoint].query_budget
+
+    # Cold caches first, then warm
+    for _ in range(2):
+        statements.clear()
+        response = client.get(url)
+        response.get_data()
+        response.close()
+        assert response.status_code == 200
+        assert len(statements) <= budget, f"{url}: {len(statements)} queries\n" + '\n'.join(statements)
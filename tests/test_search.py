@@ -0,0 +1,25 @@
+import pytest
+
+from app import db
+from models import Order
+from tracking_numbers import generate_tracking_number
+
+
+@pytest.fixture
+def phone_order(app):
+    with app.app_context():
+        tracking_number = generate_tracking_number()
+        db.session.add(Order(
+            tracking_number=tracking_number, customer_name='Поиск по телефону',
+            customer_phone='8 705 999 88 77', shipping_type='astana',
+            pickup_address='Астана, ул. Сыганак 10', delivery_address='Астана, ул. Достык 5',
+            cargo_description='Паллеты', status='new'
+        ))
+        db.session.commit()
+    return tracking_number
+
+
+@pytest.mark.parametrize('query', ['87059998877', '77059998877', '+7 705 999 88 77', '8 (705) 999-88-77', '999 88'])
+def test_phone_search_matches_any_spelling(logist_client, phone_order, query):
+    response = logist_client.get('/admin/orders', query_string={'q': query})
+    assert phone_order in response.get_data(as_text=True)
@@ -0,0 +1,16 @@
+from datetime import datetime, timedelta
+
+from app import db
+from models import OrderLeadTimeStat
+from status_history import refresh_lead_time_stats_if_stale
+
+
+def test_lead_times_refresh_only_when_stale(app, dataset):
+    with app.app_context():
+        assert refresh_lead_time_stats_if_stale(max_age=3600)
+        assert OrderLeadTimeStat.query.count() > 0
+        assert not refresh_lead_time_stats_if_stale(max_age=3600)
+
+        OrderLeadTimeStat.query.update({'computed_at': datetime.utcnow() - timedelta(hours=2)})
+        db.session.commit()
+        assert refresh_lead_time_stats_if_stale(max_age=3600)
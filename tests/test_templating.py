@@ -0,0 +1,10 @@
+def test_flash_is_shown_once_on_streamed_page(logist_client):
+    with logist_client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Проверочное сообщение')]
+
+    first = logist_client.get('/admin/orders')
+    assert first.is_streamed
+    assert 'Проверочное сообщение' in first.get_data(as_text=True)
+
+    second = logist_client.get('/admin/orders')
+    assert 'Проверочное сообщение' not in second.get_data(as_text=True)
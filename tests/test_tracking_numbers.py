@@ -0,0 +1,35 @@
+import random
+
+from tracking_numbers import (ALPHABET, SEQUENCE_MODULUS, generate_tracking_number, is_valid_tracking_number,
+                              permute_sequence)
+
+
+def test_permutation_is_a_bijection_on_a_sample():
+    key = random.getrandbits(62)
+    values = random.sample(range(SEQUENCE_MODULUS), 20000) + [0, SEQUENCE_MODULUS - 1]
+    permuted = [permute_sequence(value, key) for value in values]
+    assert len(set(permuted)) == len(values)
+    assert all(0 <= value < SEQUENCE_MODULUS for value in permuted)
+
+
+def decode_sequence(number):
+    value = 0
+    for char in number[8:-1]:
+        value = value * len(ALPHABET) + ALPHABET.index(char)
+    return value
+
+
+def test_consecutive_numbers_are_not_adjacent(app):
+    with app.app_context():
+        numbers = [generate_tracking_number() for _ in range(50)]
+    assert len(set(numbers)) == len(numbers)
+    assert all(is_valid_tracking_number(number) for number in numbers)
+    sequences = [decode_sequence(number) for number in numbers]
+    assert not any(abs(later - earlier) < 1000 for earlier, later in zip(sequences, sequences[1:]))
+
+
+def test_check_character_rejects_typos(app):
+    with app.app_context():
+        number = generate_tracking_number()
+    typo = number[:-2] + ('0' if number[-2] != '0' else '1') + number[-1]
+    assert not is_valid_tracking_number(typo)
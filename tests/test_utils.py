@@ -0,0 +1,22 @@
+import pytest
+
+from utils import normalize_phone, format_phone_number
+
+
+@pytest.mark.parametrize('phone, expected', [
+    ('+7 701 123 45 67', '+77011234567'),
+    ('8 701 123 45 67', '+77011234567'),
+    ('7 (701) 123-45-67', '+77011234567'),
+    ('701 123 45 67', '+77011234567'),
+    ('+81312345678', '+81312345678'),
+    ('+8 10 123 4567', '+8101234567'),
+    ('+49 30 1234567', '+49301234567'),
+    ('12345', None),
+    ('', None),
+])
+def test_normalize_phone(phone, expected):
+    assert normalize_phone(phone) == expected
+
+
+def test_format_normalized_phone():
+    assert format_phone_number('+77011234567') == '+7 (701) 123-45-67'
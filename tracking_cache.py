@@ -0,0 +1,212 @@
+"""Cached read model for the public tracking page.
+
+Lookups go through up to two tiers: an in-process LRU (no network round trip)
+and, when REDIS_URL is set and the redis package is installed, a shared Redis
+tier. Unknown tracking numbers are cached too, with a shorter TTL, so
+enumeration and refresh storms don't reach the database. Entries are dropped
+as soon as an order change commits (see order_events.py).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+
+from app import app, db
+from models import Order, Driver
+from order_events import on_order_change
+from db_routing import reads_from_replica
+
+try:
+    import redis
+except ImportError:  # the shared tier is optional
+    redis = None
+
+MISSING = {'missing': True}
+
+TRACKING_COLUMNS = (
+    Order.id, Order.tracking_number, Order.status, Order.shipping_type,
+    Order.customer_name, Order.customer_phone, Order.customer_email,
+    Order.pickup_address, Order.pickup_contact, Order.delivery_address, Order.delivery_contact,
+    Order.cargo_description, Order.cargo_weight, Order.cargo_dimensions, Order.customer_notes,
+    Order.price, Order.created_at, Order.updated_at,
+)
+
+
+class LocalLRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + min(ttl, self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisCache:
+    """Shared tier; values are stored as JSON"""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+
+    def get(self, key):
+        try:
+            raw = self.client.get(key)
+        except redis.RedisError:
+            return None
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(key, json.dumps(value, default=str), ex=int(ttl))
+        except redis.RedisError:
+            pass
+
+    def delete(self, key):
+        try:
+            self.client.delete(key)
+        except redis.RedisError:
+            pass
+
+
+class TrackingView:
+    """Read-only order snapshot with the attributes track_order.html uses"""
+    get_status_display = Order.get_status_display
+    get_shipping_type_display = Order.get_shipping_type_display
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+        for field in ('created_at', 'updated_at'):
+            if isinstance(data.get(field), str):
+                setattr(self, field, datetime.fromisoformat(data[field]))
+        driver_name = data.get('driver_name')
+        self.assigned_driver = SimpleNamespace(name=driver_name, phone=data.get('driver_phone')) if driver_name else None
+
+
+def _build_tiers():
+    tiers = []
+    if app.config['TRACKING_LOCAL_CACHE_SIZE'] > 0:
+        tiers.append(LocalLRUCache(app.config['TRACKING_LOCAL_CACHE_SIZE'], app.config['TRACKING_LOCAL_CACHE_TTL']))
+    if redis is not None and app.config.get('REDIS_URL'):
+        tiers.append(RedisCache(app.config['REDIS_URL']))
+    return tiers
+
+
+_tiers = _build_tiers()
+
+
+def _cache_key(tracking_number):
+    return f"track:{tracking_number}"
+
+
+def load_tracking_data(tracking_number):
+    """Fetch the read model for one order in a single query, or None"""
+    row = db.session.query(
+        *TRACKING_COLUMNS,
+        Driver.name.label('driver_name'),
+        Driver.phone.label('driver_phone')
+    ).outerjoin(Driver, Order.driver_id == Driver.id).filter(
+        Order.tracking_number == tracking_number
+    ).first()
+    if row is None:
+        return None
+    data = row._asdict()
+    for field in ('created_at', 'updated_at'):
+        if data[field] is not None:
+            data[field] = data[field].isoformat()
+    return data
+
+
+def get_tracking_data(tracking_number):
+    """Tracking read model as a plain dict, or None for unknown numbers"""
+    key = _cache_key(tracking_number)
+    for index, tier in enumerate(_tiers):
+        data = tier.get(key)
+        if data is not None:
+            # Backfill the faster tiers that missed
+            for faster in _tiers[:index]:
+                faster.set(key, data, app.config['TRACKING_CACHE_TTL'])
+            return None if data == MISSING else data
+
+    data = load_tracking_data(tracking_number)
+    ttl = app.config['TRACKING_CACHE_TTL'] if data else app.config['TRACKING_NEGATIVE_TTL']
+    if reads_from_replica():
+        # A lagging replica may return the state from before the last
+        # invalidation; don't let it stick for the full TTL
+        ttl = min(ttl, app.config['REPLICA_STICKY_SECONDS'])
+    for tier in _tiers:
+        tier.set(key, data or MISSING, ttl)
+    return data
+
+
+def get_tracking_view(tracking_number):
+    data = get_tracking_data(tracking_number)
+    return TrackingView(data) if data else None
+
+
+def tracking_etag(data):
+    """Entity tag for a tracking snapshot; changes whenever the order is updated"""
+    return hashlib.sha1(f"{data['tracking_number']}|{data['updated_at']}".encode()).hexdigest()[:20]
+
+
+def tracking_payload(data):
+    """Public JSON representation; customer contact details are left out"""
+    view = TrackingView(data)
+    return {
+        'tracking_number': data['tracking_number'],
+        'status': data['status'],
+        'status_display': view.get_status_display(),
+        'shipping_type': data['shipping_type'],
+        'shipping_type_display': view.get_shipping_type_display(),
+        'created_at': data['created_at'],
+        'updated_at': data['updated_at'],
+    }
+
+
+# Long-polling requests in this process wait on this instead of hitting the cache in a loop
+_change_condition = threading.Condition()
+
+
+def wait_for_tracking_change(timeout):
+    """Block until an order change commits in this process or the timeout expires"""
+    with _change_condition:
+        _change_condition.wait(timeout)
+
+
+def invalidate_tracking(tracking_number):
+    key = _cache_key(tracking_number)
+    for tier in _tiers:
+        tier.delete(key)
+
+
+@on_order_change(after_commit=True)
+def invalidate_changed_orders(changes):
+    for change in changes:
+        invalidate_tracking(change.tracking_number)
+    with _change_condition:
+        _change_condition.notify_all()
@@ -0,0 +1,118 @@
+"""Tracking number generation and validation.
+
+Numbers look like ``HK250813`` + 6-character sequence + 1 check character,
+all in the Crockford base32 alphabet (no I, L, O, U). The sequence comes from
+the ``tracking_sequence`` table, which each process reserves in blocks. Each
+value is passed through a keyed permutation of the 30-bit sequence space
+before it is encoded. The permutation is a Feistel network keyed with the
+random ``permutation_key`` stored next to the counter. Distinct values still
+give distinct numbers, so numbers stay unique by construction. Consecutive
+orders get unrelated numbers, so the public tracking page can't be walked
+through by counting from a known number. The date prefix
+keeps each day's inserts within one narrow range of the unique index. The
+check character (Luhn mod 32) lets malformed numbers be rejected before they
+reach the database.
+
+Numbers issued before this scheme (``HK`` + date + 6 random A-Z0-9, 14
+characters) are still accepted, but only checked for shape.
+"""
+import hashlib
+import hmac
+import re
+import threading
+from datetime import datetime
+from sqlalchemy import update
+
+from app import app, db
+from models import TrackingSequence
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+SEQUENCE_LENGTH = 6
+SEQUENCE_MODULUS = len(ALPHABET) ** SEQUENCE_LENGTH
+HALF_BITS = (SEQUENCE_MODULUS.bit_length() - 1) // 2
+FEISTEL_ROUNDS = 4
+
+TRACKING_NUMBER_RE = re.compile(rf'^HK\d{{6}}[{ALPHABET}]{{{SEQUENCE_LENGTH + 1}}}$')
+LEGACY_TRACKING_NUMBER_RE = re.compile(r'^HK\d{6}[A-Z0-9]{6}$')
+
+
+def check_character(body):
+    """Luhn mod N check character over the Crockford base32 alphabet"""
+    factor, total = 2, 0
+    for char in reversed(body):
+        addend = factor * ALPHABET.index(char)
+        total += addend // len(ALPHABET) + addend % len(ALPHABET)
+        factor = 1 if factor == 2 else 2
+    return ALPHABET[(len(ALPHABET) - total % len(ALPHABET)) % len(ALPHABET)]
+
+
+def encode_sequence(value):
+    value %= SEQUENCE_MODULUS
+    chars = []
+    for _ in range(SEQUENCE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def permute_sequence(value, key):
+    """Keyed bijection on [0, SEQUENCE_MODULUS): a balanced Feistel network with HMAC rounds"""
+    mask = (1 << HALF_BITS) - 1
+    value %= SEQUENCE_MODULUS
+    left, right = value >> HALF_BITS, value & mask
+    secret = key.to_bytes(8, 'big')
+    for round_number in range(FEISTEL_ROUNDS):
+        digest = hmac.new(secret, bytes([round_number]) + right.to_bytes(4, 'big'), hashlib.sha256).digest()
+        left, right = right, left ^ (int.from_bytes(digest[:4], 'big') & mask)
+    return left << HALF_BITS | right
+
+
+class BlockAllocator:
+    """Hands out sequence values from blocks reserved in the database"""
+
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._next = self._end = 0
+        self.permutation_key = None
+        self._lock = threading.Lock()
+
+    def _reserve_block(self):
+        table = TrackingSequence.__table__
+        # Own short transaction, so the reservation never waits on the order's commit
+        with db.engine.begin() as connection:
+            end, self.permutation_key = connection.execute(
+                update(table).where(table.c.name == self.name)
+                .values(next_value=table.c.next_value + self.block_size)
+                .returning(table.c.next_value, table.c.permutation_key)
+            ).one()
+        self._next, self._end = end - self.block_size, end
+
+    def next_value(self):
+        """The next sequence value, scrambled with the sequence's permutation key"""
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve_block()
+            value = self._next
+            self._next += 1
+            return permute_sequence(value, self.permutation_key) if self.permutation_key else value
+
+
+_allocator = BlockAllocator('order', app.config['TRACKING_SEQUENCE_BLOCK'])
+
+
+def generate_tracking_number():
+    """Generate a unique tracking number"""
+    body = datetime.now().strftime('%y%m%d') + encode_sequence(_allocator.next_value())
+    return f'HK{body}{check_character(body)}'
+
+
+def normalize_tracking_number(tracking_number):
+    return (tracking_number or '').strip().upper()
+
+
+def is_valid_tracking_number(tracking_number):
+    """Cheap format and check-character validation, done before any lookup"""
+    if TRACKING_NUMBER_RE.match(tracking_number):
+        return check_character(tracking_number[2:-1]) == tracking_number[-1]
+    return bool(LEGACY_TRACKING_NUMBER_RE.match(tracking_number))
@@ -0,0 +1,57 @@
+"""Per-process cache for the Flask-Login user loader.
+
+Without it every authenticated request starts with a SELECT on the user
+table. Column values of loaded users are kept for USER_CACHE_TTL seconds and
+attached to the request's session again without a query, so current_user
+behaves like a freshly loaded User (lazy relationships included).
+
+A commit that changes a user (role, password or anything else) evicts it in
+the committing process right away; other workers pick up the change when
+their entry expires, so USER_CACHE_TTL bounds how long a revoked role or
+password stays usable there.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app import app, db
+from models import User
+from tracking_cache import LocalLRUCache
+
+_users = LocalLRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+_columns = [attr.key for attr in inspect(User).column_attrs]
+
+
+def load_user(user_id):
+    """User for the id in the session cookie, from the cache when possible"""
+    values = _users.get(user_id)
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            _users.set(user_id, {key: getattr(user, key) for key in _columns}, app.config['USER_CACHE_TTL'])
+        return user
+
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(user_id):
+    _users.delete(user_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    changed = [obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)]
+    if changed:
+        session.info.setdefault('changed_users', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def evict_changed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_users(session):
+    session.info.pop('changed_users', None)
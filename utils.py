@@ -1,24 +1,37 @@
-import random
-import string
-import requests
 import os
-from datetime import datetime
-
-def generate_tracking_number():
-    """Generate a unique tracking number"""
-    timestamp = datetime.now().strftime('%y%m%d')
-    random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f'HK{timestamp}{random_part}'
+from senders import get_sender, DeliveryError
 
 def send_sms_notification(phone, message):
-    """Send SMS notification (placeholder for SMS service integration)"""
-    # This would integrate with an SMS service like SMS.ru, SMSC.ru, etc.
-    # For now, we'll just log the message
-    print(f"SMS to {phone}: {message}")
-    return True
+    """Send SMS notification through the registered SMS sender (see senders.py)"""
+    try:
+        get_sender('sms').send(phone, message)
+        return True
+    except DeliveryError as e:
+        print(f"Failed to send SMS notification: {e}")
+        return False
+
+def normalize_phone(phone):
+    """Normalize a phone number to E.164 (+7XXXXXXXXXX for Kazakhstan), or None if it can't be"""
+    if not phone:
+        return None
+    digits = ''.join(filter(str.isdigit, phone))
+    
+    if phone.strip().startswith('+'):
+        # Already international: +8... is a foreign number, not the 8 trunk prefix
+        return '+' + digits if 8 <= len(digits) <= 15 else None
+    if len(digits) == 11 and digits[0] in '78':
+        return '+7' + digits[1:]
+    elif len(digits) == 10 and digits.startswith('7'):
+        # Local format without the country code, e.g. 701 123 45 67
+        return '+7' + digits
+    return None
 
 def format_phone_number(phone):
     """Format phone number for display"""
+    # Already normalized (see normalize_phone): format by slicing
+    if phone and len(phone) == 12 and phone.startswith('+7') and phone[1:].isdigit():
+        return f"+7 ({phone[2:5]}) {phone[5:8]}-{phone[8:10]}-{phone[10:12]}"
+    
     # Remove all non-digit characters
     digits_only = ''.join(filter(str.isdigit, phone))
     
@@ -30,31 +43,38 @@ def format_phone_number(phone):
     else:
         return phone
 
+def format_duration(seconds):
+    """Format a duration in seconds as days/hours/minutes, e.g. '2 д 4 ч'"""
+    if seconds is None:
+        return '—'
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days} д {hours} ч"
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    return f"{minutes} мин"
+
 def format_currency(amount):
     """Format currency amount in Tenge"""
     if amount is None:
         return "Не указана"
     return f"{amount:,.0f} ₸"
 
-def send_telegram_notification(message):
+def send_telegram_notification(message, chat_id=None):
     """Send notification to Telegram channel/group"""
-    bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
-    chat_id = os.environ.get('TELEGRAM_CHAT_ID')
+    sender = get_sender('telegram')
+    chat_id = sender.resolve_recipient(chat_id)
     
-    if not bot_token or not chat_id:
+    if not os.environ.get('TELEGRAM_BOT_TOKEN') or not chat_id:
         print(f"Telegram notification: {message}")
         return False
     
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    data = {
-        'chat_id': chat_id,
-        'text': message,
-        'parse_mode': 'HTML'
-    }
-    
     try:
-        response = requests.post(url, data=data, timeout=10)
-        return response.status_code == 200
-    except Exception as e:
+        sender.send(chat_id, message)
+        sender.limiter.mark_sent(chat_id)
+        return True
+    except DeliveryError as e:
         print(f"Failed to send Telegram notification: {e}")
         return False